@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import numpy as np
+import pandas as pd
+
+cwd = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(cwd, "../preprocessing"))
+sys.path.append(os.path.join(cwd, "../server"))
+from pyulog import ULog
+from ulog2csv import cols_to_df, extract_topics, synchronize_timeseries, timeline_index
+from derived import add_euler_angles
+from flight_io import write_flight
+from flight_statistics import compute_statistics
+from loading import load_flight
+from plotting import create_plots, plot_df, update_plots
+from synthetic import synthetic_topics, write_synthetic_ulog
+
+
+def measure(func, repeat: int) -> dict:
+    # Best of repeat runs, the minimum is the least noisy estimate
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {"seconds": min(timings), "runs": timings}
+
+
+def convert(ulog) -> pd.DataFrame:
+    cols = extract_topics(ulog)
+    timeline = synchronize_timeseries(cols, timeline_index(cols))
+    return cols_to_df(cols, timeline)
+
+
+def bench_size(work_dir: str, duration_s: float, topic_count: int, flights: int, repeat: int) -> dict:
+    results = {}
+    data_dir = os.path.join(work_dir, f"{int(duration_s)}s", "data")
+    csv_dir = os.path.join(data_dir, "csv_files")
+    os.makedirs(csv_dir)
+
+    ulog_path = os.path.join(work_dir, f"{int(duration_s)}s.ulg")
+    write_synthetic_ulog(ulog_path, duration_s, synthetic_topics(topic_count))
+
+    results["parse"] = measure(lambda: ULog(ulog_path), repeat)
+    ulog = ULog(ulog_path)
+    add_euler_angles(ulog)
+    results["convert"] = measure(lambda: convert(ulog), repeat)
+    df = convert(ulog)
+
+    csv_path = os.path.join(csv_dir, "flight_0.csv")
+    results["to_csv"] = measure(lambda: write_flight(df, csv_path), repeat)
+    # a small corpus of identical flights, every other one annotated
+    mapping = {}
+    for i in range(1, flights):
+        shutil.copy(csv_path, os.path.join(csv_dir, f"flight_{i}.csv"))
+    for i in range(0, flights, 2):
+        start, end = int(df["timestamp"].iloc[0]), int(df["timestamp"].iloc[-1])
+        mapping[f"flight_{i}"] = {"annotations": [
+            {"class": "Normal", "note": "", "ranges": [["Position X", [[start, (start + end) // 2]]]]}
+        ]}
+    with open(os.path.join(data_dir, "mapping.json"), "w") as f:
+        json.dump(mapping, f)
+
+    # in-process like the conversion stages, without the cache like --rebuild-cache
+    results["flight_statistics"] = measure(
+        lambda: compute_statistics(data_dir, jobs=os.cpu_count(), use_cache=False), repeat)
+
+    results["load_file"] = measure(lambda: load_flight(csv_path, 1600), repeat)
+    loaded = load_flight(csv_path, 1600)
+    results["plot_df"] = measure(lambda: plot_df(loaded.copy(), mapping, "flight_0.csv"), repeat)
+    # a file switch in a running session only replaces the data of its figures
+    plots = create_plots()
+    update_plots(plots, loaded.copy(), mapping, "flight_0.csv")
+    results["update_plots"] = measure(lambda: update_plots(plots, loaded.copy(), mapping, "flight_1.csv"), repeat)
+
+    for result in results.values():
+        result.update(rows=int(df.shape[0]), columns=int(df.shape[1]))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    # Print the ratio against the baseline, returns the number of regressions
+    regressions = 0
+    print(f"\n{'benchmark':>32} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        previous = baseline["results"][name]["seconds"]
+        ratio = result["seconds"] / previous if previous > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions += 1
+            flag = " REGRESSION"
+        print(f"{name:>32} {previous:10.4f} {result['seconds']:10.4f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark conversion, statistics and server loading '
+                                                 'on synthetic flights')
+    parser.add_argument('--sizes', default='60,300,1200',
+                        help='Comma separated flight durations in seconds (default: 60,300,1200)')
+    parser.add_argument('--topics', type=int, default=None,
+                        help='Number of get_custom_topics() topics to generate (default: all)')
+    parser.add_argument('--flights', type=int, default=4,
+                        help='Number of flights in the statistics corpus (default: 4)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark (default: 3)')
+    parser.add_argument('--output', default='bench_results.json', help='Result file (default: bench_results.json)')
+    parser.add_argument('--baseline', default=None, help='Compare against a previous result file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown against the baseline before failing (default: 0.2)')
+    args = parser.parse_args()
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "params": vars(args),
+        "results": {},
+    }
+    work_dir = tempfile.mkdtemp(prefix="ulog_bench_")
+    try:
+        for size in [float(size) for size in args.sizes.split(",")]:
+            for name, result in bench_size(work_dir, size, args.topics, args.flights, args.repeat).items():
+                key = f"{name}@{int(size)}s"
+                results["results"][key] = result
+                print(f"{key:>32}: {result['seconds']:.4f}s ({result['rows']} rows, {result['columns']} columns)")
+    finally:
+        shutil.rmtree(work_dir)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
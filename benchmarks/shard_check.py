@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+
+cwd = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(cwd, "../preprocessing"))
+from leases import LEASE_DIR, lease_path
+from manifest import load_manifest
+from synthetic import write_synthetic_ulog
+
+converter = os.path.join(cwd, "../preprocessing/ulog2csv.py")
+converted_line = re.compile(r"^\d+ \| Converted (.+) to ")
+
+
+def run_workers(data_dir: str, workers: int, jobs: int, ttl: float) -> Counter:
+    # Start all workers at once like hosts sharing a volume, count conversions per log
+    processes = [
+        subprocess.Popen([sys.executable, converter, "--shard", "--data-dir", data_dir, "--jobs", str(jobs),
+                          "--lease-ttl", str(ttl)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for _ in range(workers)
+    ]
+    conversions = Counter()
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode != 0:
+            print(output)
+            raise RuntimeError(f"worker exited with {process.returncode}")
+        for line in output.splitlines():
+            match = converted_line.match(line)
+            if match:
+                conversions[os.path.relpath(os.path.realpath(match.group(1)),
+                                            os.path.realpath(os.path.join(data_dir, "ulg_files")))] += 1
+    return conversions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that sharded ulog2csv workers convert every log exactly once')
+    parser.add_argument('--logs', type=int, default=24, help='Number of synthetic logs (default: 24)')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent ulog2csv processes (default: 4)')
+    parser.add_argument('--jobs', type=int, default=2, help='Worker processes per ulog2csv (default: 2)')
+    parser.add_argument('--duration', type=float, default=20, help='Flight duration in seconds (default: 20)')
+    args = parser.parse_args()
+
+    ttl = 5
+    data_dir = tempfile.mkdtemp(prefix="ulog_shard_")
+    try:
+        ulg_dir = os.path.join(data_dir, "ulg_files")
+        csv_dir = os.path.join(data_dir, "csv_files")
+        keys = [os.path.join(f"host_{i % 3}", f"flight_{i}.ulg") for i in range(args.logs)]
+        for i, key in enumerate(keys):
+            os.makedirs(os.path.join(ulg_dir, os.path.dirname(key)), exist_ok=True)
+            write_synthetic_ulog(os.path.join(ulg_dir, key), args.duration, seed=i)
+
+        # a worker that crashed while holding a lease, it must be taken over after the ttl
+        stale = lease_path(os.path.join(csv_dir, LEASE_DIR), keys[0])
+        os.makedirs(os.path.dirname(stale))
+        with open(stale, "w") as f:
+            json.dump({"key": keys[0], "owner": "crashed-host:1", "token": "stale", "ttl": ttl}, f)
+        os.utime(stale, (time.time() - 2 * ttl, time.time() - 2 * ttl))
+
+        failures = []
+        conversions = run_workers(data_dir, args.workers, args.jobs, ttl)
+        twice = sorted(key for key, count in conversions.items() if count > 1)
+        missed = sorted(set(keys) - set(conversions))
+        if twice:
+            failures.append(f"converted more than once: {twice}")
+        if missed:
+            failures.append(f"never converted: {missed}")
+
+        manifest = load_manifest(csv_dir)
+        unrecorded = [key for key in keys if manifest.get(key, {}).get("status") != "converted"]
+        if unrecorded:
+            failures.append(f"missing manifest entries: {unrecorded}")
+        leftover = [name for name in os.listdir(os.path.join(csv_dir, LEASE_DIR))]
+        if leftover:
+            failures.append(f"leases left behind: {leftover}")
+
+        # a second round finds everything up to date
+        again = run_workers(data_dir, args.workers, args.jobs, ttl)
+        if again:
+            failures.append(f"converted again although up to date: {sorted(again)}")
+
+        print(f"{args.logs} logs, {args.workers} workers x {args.jobs} jobs: "
+              f"{sum(conversions.values())} conversions, {len(twice)} duplicated, {len(missed)} missed")
+        for failure in failures:
+            print("FAIL:", failure)
+        if failures:
+            sys.exit(1)
+        print("OK")
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../preprocessing"))
+from ulog2csv import get_custom_topics
+from field_types import is_discrete
+
+# ULog type names and numpy codes of the generated fields
+FIELD_TYPES = {
+    "float": "<f4",
+    "double": "<f8",
+    "uint8_t": "u1",
+    "bool": "u1",
+}
+
+# Logging rates (Hz) roughly matching PX4 defaults, other topics use DEFAULT_RATE
+TOPIC_RATES = {
+    "sensor_combined": 200,
+    "vehicle_angular_velocity": 200,
+    "vehicle_attitude": 100,
+    "actuator_controls_0": 100,
+    "vehicle_rates_setpoint": 100,
+    "vehicle_local_position": 50,
+    "actuator_outputs": 50,
+    "vehicle_attitude_setpoint": 50,
+    "vehicle_magnetometer": 20,
+    "vehicle_air_data": 20,
+    "gps_position": 5,
+    "vehicle_global_position": 10,
+    "vehicle_status": 2,
+    "battery_status": 1,
+    "cpuload": 1,
+    "system_power": 1,
+    "telemetry_status": 1,
+    "vehicle_land_detected": 1,
+}
+DEFAULT_RATE = 10
+
+# Fields computed by add_euler_angles() and the quaternions it needs
+DERIVED_FIELDS = {"vehicle_attitude": {"roll", "pitch", "yaw"}}
+QUATERNION_FIELDS = {
+    "vehicle_attitude": [f"q[{i}]" for i in range(4)],
+    "vehicle_attitude_setpoint": [f"q_d[{i}]" for i in range(4)],
+}
+
+
+def synthetic_topics(topic_count: int = None) -> dict:
+    # Topics and fields of get_custom_topics(), optionally only the first topic_count
+    topics = get_custom_topics()
+    names = list(topics)[:topic_count] if topic_count else list(topics)
+    synthetic = {}
+    for name in names:
+        fields = [field for field in topics[name] if field not in DERIVED_FIELDS.get(name, ())]
+        synthetic[name] = fields + [field for field in QUATERNION_FIELDS.get(name, []) if field not in fields]
+    return synthetic
+
+
+def _field_type(topic: str, field: str) -> str:
+    # discrete fields get small integer values instead of smooth signals
+    if is_discrete(topic, field):
+        return "uint8_t"
+    if topic == "vehicle_global_position" and field in ("lat", "lon"):
+        return "double"
+    return "float"
+
+
+def _quaternion(t: np.ndarray) -> np.ndarray:
+    # Unit quaternion of a slowly yawing vehicle with small roll/pitch oscillations
+    yaw = 0.5 * np.sin(2 * np.pi * t / 60)
+    roll = 0.1 * np.sin(2 * np.pi * t / 7)
+    pitch = 0.1 * np.cos(2 * np.pi * t / 11)
+    cr, sr = np.cos(roll / 2), np.sin(roll / 2)
+    cp, sp = np.cos(pitch / 2), np.sin(pitch / 2)
+    cy, sy = np.cos(yaw / 2), np.sin(yaw / 2)
+    return np.stack([cr * cp * cy + sr * sp * sy,
+                     sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy]).astype(np.float32)
+
+
+def _field_values(topic: str, field: str, t: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    duration = t[-1] - t[0] if len(t) > 1 else 1.0
+    if field in QUATERNION_FIELDS.get(topic, ()):
+        return _quaternion(t)[QUATERNION_FIELDS[topic].index(field)]
+    if _field_type(topic, field) == "uint8_t":
+        # a handful of state changes over the flight
+        changes = np.sort(rng.uniform(t[0], t[-1], size=4))
+        return (np.searchsorted(changes, t) % 3).astype(np.uint8)
+    if topic == "vehicle_global_position" and field in ("lat", "lon"):
+        origin = 47.397 if field == "lat" else 8.545
+        return origin + 1e-4 * np.sin(2 * np.pi * t / duration)
+    period = rng.uniform(5, 60)
+    signal = np.sin(2 * np.pi * t / period + rng.uniform(0, 2 * np.pi))
+    return (signal + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def _message(msg_type: str, payload: bytes) -> bytes:
+    return np.array([len(payload)], dtype="<u2").tobytes() + msg_type.encode() + payload
+
+
+def write_synthetic_ulog(path: str, duration_s: float, topics: dict = None, rates: dict = None,
+                         seed: int = 0) -> None:
+    """Write a ULog file with every topic logged at its rate for duration_s seconds"""
+    topics = topics or synthetic_topics()
+    rates = {**TOPIC_RATES, **(rates or {})}
+    rng = np.random.default_rng(seed)
+    start_us = 1_000_000
+
+    with open(path, "wb") as f:
+        # file header: magic, version and start timestamp
+        f.write(b"ULog\x01\x12\x35\x01" + np.array([start_us], dtype="<u8").tobytes())
+        for name, fields in topics.items():
+            definition = f"{name}:uint64_t timestamp;" + "".join(
+                f"{_field_type(name, field)} {field};" for field in fields)
+            f.write(_message("F", definition.encode()))
+        for msg_id, name in enumerate(topics):
+            f.write(_message("A", bytes([0]) + np.array([msg_id], dtype="<u2").tobytes() + name.encode()))
+
+        # data messages of a topic are built at once as a packed record array
+        for msg_id, (name, fields) in enumerate(topics.items()):
+            rate = rates.get(name, DEFAULT_RATE)
+            t = np.arange(0, duration_s, 1 / rate)
+            dtype = np.dtype(
+                [("size", "<u2"), ("type", "u1"), ("msg_id", "<u2"), ("timestamp", "<u8")]
+                + [(f"f{i}", FIELD_TYPES[_field_type(name, field)]) for i, field in enumerate(fields)]
+            )
+            records = np.zeros(len(t), dtype=dtype)
+            records["size"] = dtype.itemsize - 3
+            records["type"] = ord("D")
+            records["msg_id"] = msg_id
+            records["timestamp"] = start_us + (t * 1e6).astype(np.uint64)
+            for i, field in enumerate(fields):
+                records[f"f{i}"] = _field_values(name, field, t, rng)
+            f.write(records.tobytes())
@@ -0,0 +1,89 @@
+import numpy as np
+from typing import List
+
+# Bump when a formula below changes, flights converted with another version are
+# converted again by --skip-processed and the ingestion daemon
+DERIVED_VERSION = 3
+# Fields add_euler_angles() adds to the topics, they are not part of field_data
+EULER_FIELDS = {
+    "vehicle_attitude": ["roll", "pitch", "yaw"],
+    "vehicle_vision_attitude": ["roll", "pitch", "yaw"],
+    "vehicle_attitude_groundtruth": ["roll", "pitch", "yaw"],
+    "vehicle_attitude_setpoint": ["roll_d", "pitch_d", "yaw_d"],
+}
+# Scale of the lat/lon and alt fields to degrees and meters, scaled values are
+# written to lat_deg/lon_deg/alt_m next to the raw fields
+GEODETIC_SCALES = {
+    "vehicle_global_position": (1.0, 1.0),
+    "vehicle_gps_position": (1e-7, 1e-3),
+}
+# Using simple approximation: 1 degree = 111,111 meters at the equator
+METERS_PER_DEGREE = 111111
+# NED z fields that are plotted pointing up, flipped into a z_up column
+UP_AXES = [
+    "vehicle_local_position.z",
+    "vehicle_local_position_setpoint.z",
+    "vehicle_visual_odometry.z",
+    "vehicle_vision_position.z",
+]
+
+
+def add_euler_angles(ulog) -> None:
+    # Like PX4ULog.add_roll_pitch_yaw(), but the arcsin argument of the pitch is
+    # clamped like in the server, rounding noise in the quaternion gives +-pi/2
+    # instead of NaN
+    for message_data in ulog.data_list:
+        if message_data.name not in EULER_FIELDS:
+            continue
+        roll_name, pitch_name, yaw_name = EULER_FIELDS[message_data.name]
+        suffix = roll_name[len("roll"):]
+        names = [f"q{suffix}[{i}]" for i in range(4)]
+        if not all(name in message_data.data for name in names):
+            continue
+        q0, q1, q2, q3 = (message_data.data[name] for name in names)
+        message_data.data[roll_name] = np.arctan2(2.0 * (q0 * q1 + q2 * q3), 1.0 - 2.0 * (q1 * q1 + q2 * q2))
+        message_data.data[pitch_name] = np.arcsin(np.clip(2.0 * (q0 * q2 - q3 * q1), -1.0, 1.0))
+        message_data.data[yaw_name] = np.arctan2(2.0 * (q0 * q3 + q1 * q2), 1.0 - 2.0 * (q2 * q2 + q3 * q3))
+
+
+def derive_table(table) -> List[str]:
+    # Add local x/y/z from geodetic positions and the NED z axes pointing up.
+    # table maps "topic.field" to values, a dict of arrays or a DataFrame. Raw
+    # fields are left as they are, only new columns are added.
+    # Returns the names of the columns written
+    written = []
+    for topic, (degree_scale, alt_scale) in GEODETIC_SCALES.items():
+        names = [f"{topic}.{field}" for field in ("lat", "lon", "alt")]
+        if not all(name in table for name in names):
+            continue
+        lat, lon, alt = (np.asarray(table[name], dtype=np.float64) for name in names)
+        if len(lat) == 0:
+            continue
+        lat, lon, alt = lat * degree_scale, lon * degree_scale, alt * alt_scale
+        if (degree_scale, alt_scale) != (1.0, 1.0):
+            for field, values in zip(("lat_deg", "lon_deg", "alt_m"), (lat, lon, alt)):
+                table[f"{topic}.{field}"] = values
+                written.append(f"{topic}.{field}")
+        # lat/lon differences to approximate meters, relative to the first sample
+        table[f"{topic}.x"] = (lon - lon[0]) * METERS_PER_DEGREE * np.cos(np.radians(lat[0]))
+        table[f"{topic}.y"] = (lat - lat[0]) * METERS_PER_DEGREE
+        table[f"{topic}.z"] = alt - alt[0]
+        written += [f"{topic}.x", f"{topic}.y", f"{topic}.z"]
+
+    for name in UP_AXES:
+        if name in table:
+            table[f"{name}_up"] = -np.asarray(table[name])
+            written.append(f"{name}_up")
+    return written
+
+
+def derive_columns(cols: List[dict]) -> List[str]:
+    # derive_table() on extracted columns, new columns share the timestamps
+    # of their topic so the native layout keeps every topic at its own rate
+    table = {f"{col['dataset']}.{col['attr']}": col["values"] for col in cols}
+    written = derive_table(table)
+    for name in written:
+        dataset, attr = name.split(".", 1)
+        source = next(col for col in cols if col["dataset"] == dataset)
+        cols.append({"dataset": dataset, "attr": attr, "timestamp": source["timestamp"], "values": table[name]})
+    return written
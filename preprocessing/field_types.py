@@ -0,0 +1,47 @@
+import numpy as np
+
+# Fields holding states, modes, enums or flags. These must not be interpolated,
+# a value between two modes is not a mode, so they are resampled with a hold
+DISCRETE_FIELDS = {
+    "vehicle_status": {"arming_state", "vehicle_type", "nav_state", "nav_state_user_intention", "failsafe",
+                       "failsafe_and_user_took_over", "rc_signal_lost", "data_link_lost", "engine_failure",
+                       "mission_failure", "is_vtol", "in_transition_mode", "system_type", "hil_state"},
+    "vehicle_land_detected": {"ground_contact", "maybe_landed", "landed", "in_ground_effect", "freefall",
+                              "in_descend", "has_low_throttle", "at_rest"},
+    "gps_position": {"satellites_used", "fix_type", "jamming_state", "spoofing_state", "vel_ned_valid"},
+    "vehicle_gps_position": {"satellites_used", "fix_type", "jamming_state", "spoofing_state", "vel_ned_valid"},
+    "battery_status": {"connected", "warning", "cell_count", "source", "id", "priority"},
+    "input_rc": {"rc_lost", "rc_failsafe", "channel_count", "input_source"},
+    "commander_state": {"main_state"},
+    "vehicle_command": {"command", "target_system", "target_component", "source_system", "from_external"},
+    "distance_sensor": {"type", "orientation", "id"},
+}
+# Angles in [-pi, pi] that wrap around. They are interpolated the short way
+# around and wrapped back, so a yaw going from pi to -pi does not sweep through 0
+ANGLE_FIELDS = {
+    "vehicle_attitude": {"roll", "yaw"},
+    "vehicle_vision_attitude": {"roll", "yaw"},
+    "vehicle_attitude_groundtruth": {"roll", "yaw"},
+    "vehicle_attitude_setpoint": {"roll_d", "yaw_d", "yaw_body"},
+    "vehicle_local_position": {"heading", "yaw"},
+    "vehicle_local_position_setpoint": {"yaw"},
+    "trajectory_setpoint": {"yaw"},
+}
+# Field name endings that mark a discrete field in any topic
+DISCRETE_SUFFIXES = ("_state", "_mode", "_flags", "_status", "_valid")
+
+
+def is_discrete(dataset: str, attr: str) -> bool:
+    # flag_* fields are the booleans of e.g. vehicle_control_mode
+    if attr in DISCRETE_FIELDS.get(dataset, ()):
+        return True
+    return attr.endswith(DISCRETE_SUFFIXES) or attr.startswith("flag_")
+
+
+def field_kind(dataset: str, attr: str, values: np.ndarray = None) -> str:
+    # "discrete", "angle" or "continuous", empty columns are continuous so they can hold NaN
+    if values is not None and not np.asarray(values).size:
+        return "continuous"
+    if attr in ANGLE_FIELDS.get(dataset, ()):
+        return "angle"
+    return "discrete" if is_discrete(dataset, attr) else "continuous"
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Callable, List
+from resampling import align_columns, centroid_index, resample_typed
+
+# Supported flight file formats, columnar formats need pyarrow to be installed
+FLIGHT_FORMATS = {
+    "csv": ".csv",
+    "feather": ".feather",
+    "parquet": ".parquet",
+    # every topic at its native rate, aligned on demand when loaded
+    "native": ".npz",
+}
+# When the same flight exists in several formats, prefer the fastest to read
+EXTENSION_PRIORITY = [".feather", ".parquet", ".npz", ".csv"]
+# Level-of-detail pyramid stored next to a converted flight, e.g. flight.csv.lod.npz
+PYRAMID_SUFFIX = ".lod.npz"
+# List of converted flights published for a running server
+INDEX_FILE = ".index.json"
+
+
+def flight_key(rel_file: str) -> str:
+    # Flights are keyed in mapping.json by their relative path without extension
+    return os.path.splitext(rel_file)[0]
+
+
+def is_flight_file(file: str) -> bool:
+    # hidden files are temporary outputs of a conversion in progress
+    return os.path.splitext(file)[1] in EXTENSION_PRIORITY and not file.endswith(PYRAMID_SUFFIX) \
+        and not file.startswith(".")
+
+
+@contextmanager
+def atomic_output(path: str):
+    # Yield a hidden temporary path next to path and move it into place only
+    # once it was written completely, so a crash never leaves a partial output
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".tmp-{os.getpid()}-{name}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def metadata_path(path: str) -> str:
+    # Conversion metadata is stored next to the flight file, e.g. flight.csv.meta.json.
+    # The name keeps the extension, so flights of several formats do not share it
+    return path + ".meta.json"
+
+
+def write_metadata(path: str, metadata: dict) -> None:
+    with atomic_output(metadata_path(path)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f, indent=2)
+
+
+def read_metadata(path: str) -> dict:
+    # Flights converted before metadata was introduced have no sidecar
+    if not os.path.exists(metadata_path(path)):
+        return {}
+    with open(metadata_path(path), "r") as f:
+        return json.load(f)
+
+
+def write_flight(df: pd.DataFrame, path: str, metadata: dict = None) -> None:
+    extension = os.path.splitext(path)[1]
+    with atomic_output(path) as tmp_path:
+        if extension == ".feather":
+            df.to_feather(tmp_path)
+        elif extension == ".parquet":
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_csv(tmp_path, index=False)
+    if metadata is not None:
+        write_metadata(path, metadata)
+
+
+def write_native_flight(cols: List[dict], path: str, metadata: dict = None) -> None:
+    # Store each topic's timestamps once plus its fields with their own dtypes,
+    # using "topic.timestamp" and "topic.field" as array names
+    arrays = {}
+    for col in cols:
+        arrays[f'{col["dataset"]}.timestamp'] = col["timestamp"]
+        arrays[f'{col["dataset"]}.{col["attr"]}'] = col["values"]
+    # np.savez appends .npz itself when the name lacks it, write through a handle instead
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+    if metadata is not None:
+        write_metadata(path, metadata)
+
+
+def read_native_flight(path: str, columns: List[str] = None) -> List[dict]:
+    # Read topics at their native rates as a list of
+    # {"dataset", "attr", "timestamp", "values"} columns
+    cols = []
+    timestamps = {}
+    with np.load(path) as container:
+        for name in container.files:
+            dataset, attr = name.split(".", 1)
+            if attr == "timestamp" or (columns is not None and name not in columns):
+                continue
+            if dataset not in timestamps:
+                timestamps[dataset] = container[f"{dataset}.timestamp"]
+            cols.append({
+                "dataset": dataset,
+                "attr": attr,
+                "timestamp": timestamps[dataset],
+                "values": container[name],
+            })
+    return cols
+
+
+def native_timeline(path: str) -> np.ndarray:
+    # Default grid of a native flight, the timeline topic recorded by the
+    # converter or else chosen over all of its columns, so that reading a
+    # subset of columns gives the same rows as reading all of them
+    topic = read_metadata(path).get("timeline")
+    cols = []
+    with np.load(path) as container:
+        if topic is not None and f"{topic}.timestamp" in container.files:
+            return container[f"{topic}.timestamp"]
+        for name in container.files:
+            dataset, attr = name.split(".", 1)
+            if attr == "timestamp":
+                timestamp = container[name]
+                fields = sum(1 for other in container.files if other.startswith(dataset + ".")) - 1
+                cols.extend([{"timestamp": timestamp}] * fields)
+    return cols[centroid_index(cols)]["timestamp"] if cols else np.array([], dtype=np.uint64)
+
+
+def align_native_flight(cols: List[dict], grid: np.ndarray = None, method: str = "interp") -> pd.DataFrame:
+    # Align native rate topics onto grid, by default the timeline of the topic
+    # closest to the median length, which is what the table formats store
+    if grid is None:
+        grid = cols[centroid_index(cols)]["timestamp"] if cols else np.array([], dtype=np.uint64)
+    names = [f'{col["dataset"]}.{col["attr"]}' for col in cols]
+    if method == "interp":
+        # integer and boolean fields keep their type like in the table formats
+        data = dict(zip(names, resample_typed(cols, grid)))
+    else:
+        data = dict(zip(names, align_columns(cols, grid, method).T))
+    timestamp = np.asarray(grid).astype(np.int64, copy=False)
+    return pd.DataFrame({"timestamp": timestamp, **data}, copy=False)
+
+
+def read_flight(path: str, columns: List[str] | Callable[[str], bool] = None) -> pd.DataFrame:
+    # columns is a list of names or a test of a name, csv files are then read
+    # in a single pass and the other formats select from their schema
+    extension = os.path.splitext(path)[1]
+    if callable(columns) and extension != ".csv":
+        columns = [name for name in read_flight_columns(path) if columns(name)]
+    if extension == ".npz":
+        df = align_native_flight(read_native_flight(path, columns), native_timeline(path))
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+    elif extension == ".feather":
+        return pd.read_feather(path, columns=columns)
+    elif extension == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def read_flight_columns(path: str) -> List[str]:
+    # Read only the column names without loading any data
+    extension = os.path.splitext(path)[1]
+    if extension == ".npz":
+        with np.load(path) as container:
+            names = [name for name in container.files if not name.endswith(".timestamp")]
+        return ["timestamp"] + names
+    elif extension == ".feather":
+        import pyarrow
+        return pyarrow.ipc.open_file(pyarrow.memory_map(path)).schema.names
+    elif extension == ".parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def find_flight(root: str, key: str) -> str | None:
+    # Return the preferred existing file for the given flight key
+    for extension in EXTENSION_PRIORITY:
+        path = os.path.join(root, key + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def list_flights(root: str) -> List[str]:
+    # List flight files relative to root, one file per flight
+    flights = {}
+    for folder, _, files in os.walk(root):
+        # Get path relative to root
+        rel_path = os.path.relpath(folder, root)
+        for file in files:
+            if not is_flight_file(file):
+                continue
+            rel_file = file if rel_path == '.' else os.path.join(rel_path, file)
+            key = flight_key(rel_file)
+            extension = os.path.splitext(file)[1]
+            if key not in flights or \
+                    EXTENSION_PRIORITY.index(extension) < EXTENSION_PRIORITY.index(os.path.splitext(flights[key])[1]):
+                flights[key] = rel_file
+    return sorted(flights.values())
+
+
+def write_flight_index(root: str) -> None:
+    # Publish the current flight list, a running server reloads it when it changes
+    index = {"updated": time.time(), "flights": list_flights(root)}
+    with atomic_output(os.path.join(root, INDEX_FILE)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2)
+
+
+def flight_index_version(root: str) -> float | None:
+    # Cheap change check, the index is replaced as a whole on every update
+    try:
+        return os.stat(os.path.join(root, INDEX_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def read_flight_index(root: str) -> List[str]:
+    # Flights of the published index, or of a directory listing without one
+    path = os.path.join(root, INDEX_FILE)
+    if not os.path.exists(path):
+        return list_flights(root)
+    with open(path, "r") as f:
+        return json.load(f)["flights"]
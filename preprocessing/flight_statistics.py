@@ -1,37 +1,45 @@
 import os
 import json
-import pandas as pd
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from datetime import datetime
-
-# Paths
-csv_dir = 'data/csv_files'
-mapping_file = 'data/mapping.json'
-
-total_duration = 0
-vision_position_duration = 0 
-global_position_duration = 0
-gps_position_duration = 0
-vision_odometry_duration = 0
-distance_sensor_duration = 0
-baro_alt_duration = 0
-
-# Initialize additional counters for annotated files
-annotated_total_duration = 0
-annotated_vision_position_duration = 0 
-annotated_global_position_duration = 0
-annotated_gps_position_duration = 0
-annotated_vision_odometry_duration = 0
-annotated_distance_sensor_duration = 0
-annotated_baro_alt_duration = 0
-
-# Initialize overlap counters
-global_gps_overlap_duration = 0
-vision_odometry_overlap_duration = 0
-
-# Initialize annotated overlap counters
-annotated_global_gps_overlap_duration = 0
-annotated_vision_odometry_overlap_duration = 0
+from flight_io import atomic_output, find_flight, flight_key, list_flights, read_flight, read_metadata, \
+    read_native_flight
+from intervals import coverage, intersection, mask_intervals, union
+
+# Default data directory, relative to the working directory
+DEFAULT_DATA_DIR = 'data'
+
+# Sensor families, a column belongs to a family when it contains the pattern
+SENSOR_FAMILIES = {
+    "vision_position": "vehicle_vision_position",
+    "global_position": "vehicle_global_position",
+    "gps_position": "vehicle_gps_position",
+    "vision_odometry": "vehicle_visual_odometry",
+    "distance_sensor": "distance_sensor",
+    "baro_alt": "vehicle_air_data.baro_alt_meter",
+}
+# Family pairs whose overlap is reported
+OVERLAPS = {
+    "global_gps": ("global_position", "gps_position"),
+    "vision_odometry": ("vision_position", "vision_odometry"),
+}
+# Labels of the families in the totals and in the annotated statistics
+SENSOR_LABELS = {
+    "vision_position": ("Vision position", "vision position"),
+    "global_position": ("Global position", "global position"),
+    "gps_position": ("GPS position", "gps position"),
+    "vision_odometry": ("Vision odometry", "vision odometry"),
+    "distance_sensor": ("Distance sensor", "distance sensor"),
+    "baro_alt": ("Barometer altitude", "barometer altitude"),
+}
+OVERLAP_LABELS = {"global_gps": "Global+GPS", "vision_odometry": "Vision+Odometry"}
+# Flight summaries and annotation aggregates of the previous run, kept in the flight directory
+CACHE_FILE = ".statistics.json"
+# Bump when flight_summary() or annotation_aggregate() change, the cache is then rebuilt
+CACHE_VERSION = 5
+
 
 # Convert durations to hours, minutes, seconds format
 def format_duration(seconds):
@@ -40,182 +48,418 @@ def format_duration(seconds):
     seconds = int(seconds % 60)
     return f"{hours}h {minutes}m {seconds}s"
 
-# Load mapping file to identify annotated files
-with open(mapping_file, 'r') as f:
-    mapping_data = json.load(f)
-
-# Get list of annotated files
-annotated_files = set(mapping_data.keys())
-
-# Process each CSV file recursively through all subdirectories
-for root, _, files in os.walk(csv_dir):
-    for filename in files:
-        if filename.endswith('.csv'):
-            filepath = os.path.join(root, filename)
-            # Get path relative to csv_dir
-            rel_path = os.path.relpath(root, csv_dir)
-            if rel_path == '.':
-                rel_file = filename
-            else:
-                rel_file = os.path.join(rel_path, filename)
-
-            try:
-                df = pd.read_csv(filepath)
-                
-                # Get flight duration from timestamps
-                start_time = df.iloc[0]['timestamp'] 
-                end_time = df.iloc[-1]['timestamp']
-                duration = (end_time - start_time) / 1e6  # Convert microseconds to seconds
-
-                # Check if file is annotated
-                is_annotated = rel_file[:-4] in annotated_files
-                
-                # Update appropriate counters
-                if is_annotated:
-                    annotated_total_duration += duration
-                total_duration += duration
-
-                # Check for global position data
-                global_pos_columns = [col for col in df.columns if 'vehicle_global_position' in col]
-                if global_pos_columns:
-                    if not df[global_pos_columns].isna().all().all() and not (df[global_pos_columns] == 0).all().all():
-                        if is_annotated:
-                            annotated_global_position_duration += duration
-                        global_position_duration += duration
-
-                # Check for gps position data
-                gps_pos_columns = [col for col in df.columns if 'vehicle_gps_position' in col]
-                if gps_pos_columns:
-                    if not df[gps_pos_columns].isna().all().all() and not (df[gps_pos_columns] == 0).all().all():
-                        if is_annotated:
-                            annotated_gps_position_duration += duration
-                        gps_position_duration += duration
-
-                # Check for vision position data
-                vision_pos_columns = [col for col in df.columns if 'vehicle_vision_position' in col]
-                if vision_pos_columns:
-                    if not df[vision_pos_columns].isna().all().all() and not (df[vision_pos_columns] == 0).all().all():
-                        if is_annotated:
-                            annotated_vision_position_duration += duration
-                        vision_position_duration += duration
-
-                # Check for vision odometry data
-                vision_odometry_columns = [col for col in df.columns if 'vehicle_visual_odometry' in col]
-                if vision_odometry_columns:
-                    if not df[vision_odometry_columns].isna().all().all() and not (df[vision_odometry_columns] == 0).all().all():
-                        if is_annotated:
-                            annotated_vision_odometry_duration += duration
-                        vision_odometry_duration += duration
-
-                # Check for distance sensor data
-                distance_sensor_columns = [col for col in df.columns if 'distance_sensor' in col]
-                if distance_sensor_columns:
-                    if not df[distance_sensor_columns].isna().all().all() and not (df[distance_sensor_columns] == 0).all().all():
-                        if is_annotated:
-                            annotated_distance_sensor_duration += duration
-                        distance_sensor_duration += duration
-
-                # Check for barometer altitude data
-                baro_alt_columns = [col for col in df.columns if 'vehicle_air_data.baro_alt_meter' in col]
-                if baro_alt_columns:
-                    if not df[baro_alt_columns].isna().all().all() and not (df[baro_alt_columns] == 0).all().all():
-                        if is_annotated:
-                            annotated_baro_alt_duration += duration
-                        baro_alt_duration += duration
-
-                # --- Overlap statistics ---
-                # Global+GPS overlap
-                if global_pos_columns and gps_pos_columns:
-                    global_gps_overlap_duration += duration
-                    if is_annotated:
-                        annotated_global_gps_overlap_duration += duration
-
-                # Vision+Odometry overlap
-                if vision_pos_columns and vision_odometry_columns:
-                    vision_odometry_overlap_duration += duration
-                    if is_annotated:
-                        annotated_vision_odometry_overlap_duration += duration
-
-            except Exception as e:
-                print(f"Error processing {filepath}: {e}")
-
-
-
-print(f"Total flight duration: {format_duration(total_duration)} ({total_duration:.2f} seconds)")
-print(f"Vision position duration: {format_duration(vision_position_duration)} ({vision_position_duration:.2f} seconds)")
-print(f"Global position duration: {format_duration(global_position_duration)} ({global_position_duration:.2f} seconds)")
-print(f"GPS position duration: {format_duration(gps_position_duration)} ({gps_position_duration:.2f} seconds)")
-print(f"Vision odometry duration: {format_duration(vision_odometry_duration)} ({vision_odometry_duration:.2f} seconds)")
-print(f"Distance sensor duration: {format_duration(distance_sensor_duration)} ({distance_sensor_duration:.2f} seconds)")
-print(f"Barometer altitude duration: {format_duration(baro_alt_duration)} ({baro_alt_duration:.2f} seconds)")
-
-# Print overlap statistics
-print(f"\nGlobal+GPS overlap duration: {format_duration(global_gps_overlap_duration)} ({global_gps_overlap_duration:.2f} seconds)")
-print(f"Vision+Odometry overlap duration: {format_duration(vision_odometry_overlap_duration)} ({vision_odometry_overlap_duration:.2f} seconds)")
-
-# Print annotated statistics
-print("\nAnnotated Files Statistics:")
-print(f"Annotated flight duration: {format_duration(annotated_total_duration)} ({annotated_total_duration:.2f} seconds)")
-print(f"Annotated vision position duration: {format_duration(annotated_vision_position_duration)} ({annotated_vision_position_duration:.2f} seconds)")
-print(f"Annotated global position duration: {format_duration(annotated_global_position_duration)} ({annotated_global_position_duration:.2f} seconds)")
-print(f"Annotated gps position duration: {format_duration(annotated_gps_position_duration)} ({annotated_gps_position_duration:.2f} seconds)")
-print(f"Annotated vision odometry duration: {format_duration(annotated_vision_odometry_duration)} ({annotated_vision_odometry_duration:.2f} seconds)")
-print(f"Annotated distance sensor duration: {format_duration(annotated_distance_sensor_duration)} ({annotated_distance_sensor_duration:.2f} seconds)")
-print(f"Annotated barometer altitude duration: {format_duration(annotated_baro_alt_duration)} ({annotated_baro_alt_duration:.2f} seconds)")
-
-# Print annotated overlap statistics
-print(f"\nAnnotated Global+GPS overlap duration: {format_duration(annotated_global_gps_overlap_duration)} ({annotated_global_gps_overlap_duration:.2f} seconds)")
-print(f"Annotated Vision+Odometry overlap duration: {format_duration(annotated_vision_odometry_overlap_duration)} ({annotated_vision_odometry_overlap_duration:.2f} seconds)")
-
-# Calculate annotation durations from mapping.json timestamps
-print("\nAnnotation Timestamps Statistics (from mapping.json):")
-annotation_class_durations = {}
-annotation_class_full_duration = {}
-
-# Process annotations from mapping.json
-for file_path, file_data in mapping_data.items():
+
+def is_needed_column(column: str) -> bool:
+    return column == "timestamp" or any(pattern in column for pattern in SENSOR_FAMILIES.values())
+
+
+def native_intervals(filepath: str) -> dict:
+    # Time spans of non-zero data of every sensor family at the native rate of
+    # its topics, each topic only covers the time it was logged
+    cols = read_native_flight(filepath)
+    intervals = {}
+    for family, pattern in SENSOR_FAMILIES.items():
+        topics = {}
+        for col in cols:
+            if pattern in f'{col["dataset"]}.{col["attr"]}':
+                topics.setdefault(col["dataset"], []).append(col)
+        spans = []
+        for topic_cols in topics.values():
+            values = np.column_stack([np.asarray(col["values"], dtype=np.float64) for col in topic_cols])
+            rows = (~np.isnan(values) & (values != 0)).any(axis=1)
+            spans.append(mask_intervals(topic_cols[0]["timestamp"], rows))
+        intervals[family] = union(np.concatenate(spans)).tolist() if spans else []
+    return intervals
+
+
+def flight_summary(filepath: str) -> dict:
+    # Duration and sensor families of a flight, reading only the timestamp and
+    # the family columns. Families are "present" when the flight has columns of
+    # them and "valid" when these are neither all missing nor all zero, their
+    # "intervals" are the time spans of rows with non-zero data of the family.
+    # The table formats are resampled onto one timeline that holds the
+    # first/last value of a topic before it starts and after it ends, so each
+    # topic is clipped to the first/last native timestamp its meta.json records.
+    # Native flights (.npz) give the spans at the rate of every topic. Flights
+    # converted before the spans were recorded reach to the ends of the flight;
+    # "intervals_from" tells which it is. All spans are clipped to the flight
+    try:
+        df = read_flight(filepath, is_needed_column)
+        # Get flight duration from timestamps
+        start_time = df.iloc[0]['timestamp']
+        end_time = df.iloc[-1]['timestamp']
+        duration = (end_time - start_time) / 1e6  # Convert microseconds to seconds
+        spans = read_metadata(filepath).get("topic_spans")
+    except Exception as e:
+        return {"error": str(e)}
+
+    present, valid, intervals = {}, {}, {}
+    timestamp = df['timestamp'].to_numpy()
+    for family, pattern in SENSOR_FAMILIES.items():
+        columns = [col for col in df.columns if pattern in col]
+        present[family] = bool(columns)
+        values = df[columns]
+        valid[family] = bool(columns) and not values.isna().all().all() and not (values == 0).all().all()
+        topics = {}
+        for col in columns:
+            topics.setdefault(col.split(".", 1)[0], []).append(col)
+        family_spans = []
+        for topic, topic_columns in topics.items():
+            topic_values = df[topic_columns]
+            rows = (topic_values.notna() & (topic_values != 0)).any(axis=1).to_numpy()
+            topic_intervals = mask_intervals(timestamp, rows)
+            if spans is not None:
+                topic_intervals = intersection(topic_intervals, [spans[topic]] if topic in spans else [])
+            family_spans.append(topic_intervals)
+        intervals[family] = union(np.concatenate(family_spans)).tolist() if family_spans else []
+    intervals_from = "resampled" if spans is None else "topic_spans"
+    if filepath.endswith(".npz"):
+        intervals = native_intervals(filepath)
+        intervals_from = "native"
+    # topics logged before or after the timeline of the flight must not make a
+    # family, or an overlap, last longer than the flight itself
+    flight_span = [[int(timestamp[0]), int(timestamp[-1])]]
+    intervals = {family: intersection(family_intervals, flight_span).tolist()
+                 for family, family_intervals in intervals.items()}
+    return {"duration": float(duration), "rows": len(df), "start": int(timestamp[0]), "end": int(timestamp[-1]),
+            "present": present, "valid": valid, "intervals": intervals, "intervals_from": intervals_from}
+
+
+def annotation_aggregate(file_data: dict) -> dict:
+    # Classes annotated in a mapping.json entry and the time covered by each of
+    # them in seconds. The same event is often boxed on several figures, the
+    # ranges of a class are merged so that it is counted once
+    ranges = {}
     for annotation in file_data.get('annotations', []):
-        annotation_class = annotation['class']
-        if annotation_class not in annotation_class_durations:
-            annotation_class_durations[annotation_class] = 0
-            
-        # Sum up all ranges for this annotation
-        for _, ranges in annotation['ranges']:
-            for start, end in ranges:
-                duration = (end - start) / 1e6  # Convert microseconds to seconds
-                annotation_class_durations[annotation_class] += duration
-
-        # Get the full CSV file duration
-        try:
-            full_filepath = os.path.join(csv_dir, file_path + '.csv')
-            df = pd.read_csv(full_filepath)
-            start_time = df.iloc[0]['timestamp']
-            end_time = df.iloc[-1]['timestamp'] 
-            file_duration = (end_time - start_time) / 1e6  # Convert microseconds to seconds
-            
-            # Add duration to each annotation class present in this file
-            for annotation in file_data.get('annotations', []):
-                annotation_class = annotation['class']
-                if annotation_class not in annotation_class_full_duration:
-                    annotation_class_full_duration[annotation_class] = 0
-                annotation_class_full_duration[annotation_class] += file_duration
-                
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-
-# Print full file duration statistics by annotation class
-print("\nFull file duration statistics by annotation class:")
-total_full_duration = sum(annotation_class_full_duration.values())
-print(f"\nTotal duration of files with annotations: {format_duration(total_full_duration)} ({total_full_duration:.2f} seconds)")
-print("\nBy annotation class (full files):")
-for class_name, duration in sorted(annotation_class_full_duration.items()):
-    print(f"{class_name}: {format_duration(duration)} ({duration:.2f} seconds)")
-    print(f"Percentage of total annotated time: {(duration/total_full_duration)*100:.2f}%")
-
-# Print annotation statistics from mapping.json timestamps
-total_annotated_time = sum(annotation_class_durations.values())
-print(f"\nTotal time covered by annotations: {format_duration(total_annotated_time)} ({total_annotated_time:.2f} seconds)")
-print("\nBy annotation class:")
-for class_name, duration in sorted(annotation_class_durations.items()):
-    print(f"{class_name}: {format_duration(duration)} ({duration:.2f} seconds)")
-    print(f"Percentage of total flight time: {(duration/total_annotated_time)*100:.2f}%")
+        class_ranges = ranges.setdefault(annotation['class'], [])
+        for _, figure_ranges in annotation['ranges']:
+            class_ranges.extend(figure_ranges)
+    return {
+        "classes": list(ranges),
+        "coverage": {name: coverage(class_ranges) / 1e6 for name, class_ranges in ranges.items()},
+    }
+
+
+def entry_digest(file_data: dict) -> str:
+    return hashlib.sha1(json.dumps(file_data, sort_keys=True).encode()).hexdigest()
+
+
+def load_cache(directory: str) -> dict:
+    # An unreadable cache or one of another version is rebuilt from scratch
+    try:
+        with open(os.path.join(directory, CACHE_FILE), "r") as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = {}
+    if cache.get("version") != CACHE_VERSION:
+        cache = {"version": CACHE_VERSION, "flights": {}, "annotations": {}}
+    return cache
+
+
+def save_cache(directory: str, cache: dict) -> None:
+    with atomic_output(os.path.join(directory, CACHE_FILE)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+
+
+def file_signature(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def iter_summaries(directory: str, rel_files: list, cache: dict, jobs: int = 1, prune: bool = True):
+    # Yield (rel_file, flight_summary()) of every flight in order as soon as it is
+    # known. Only flights whose size or mtime changed since they were cached are
+    # read. With prune, cache entries of flights that are not listed are dropped
+    signatures = [file_signature(os.path.join(directory, rel_file)) for rel_file in rel_files]
+    stale = [i for i, (rel_file, signature) in enumerate(zip(rel_files, signatures))
+             if cache["flights"].get(rel_file, {}).get("signature") != signature]
+    if prune:
+        listed = set(rel_files)
+        cache["flights"] = {rel_file: entry for rel_file, entry in cache["flights"].items() if rel_file in listed}
+    fresh = summarize_flights([os.path.join(directory, rel_files[i]) for i in stale], jobs)
+    stale = set(stale)
+    for i, rel_file in enumerate(rel_files):
+        if i in stale:
+            cache["flights"][rel_file] = {"signature": signatures[i], "summary": next(fresh)}
+        yield rel_file, cache["flights"][rel_file]["summary"]
+
+
+def cached_aggregates(mapping_data: dict, cache: dict) -> dict:
+    # annotation_aggregate() of every mapping.json entry, recomputed for changed entries
+    annotations = {}
+    for key, file_data in mapping_data.items():
+        digest = entry_digest(file_data)
+        cached = cache["annotations"].get(key)
+        if cached is None or cached["digest"] != digest:
+            cached = {"digest": digest, "aggregate": annotation_aggregate(file_data)}
+        annotations[key] = cached
+    cache["annotations"] = annotations
+    return {key: cached["aggregate"] for key, cached in annotations.items()}
+
+
+def summarize_flights(paths: list, jobs: int = 1):
+    # Iterator over flight_summary() of every path in order, spread over jobs worker processes
+    if jobs == 1 or len(paths) < 2:
+        yield from map(flight_summary, paths)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(flight_summary, paths, chunksize=max(1, len(paths) // (jobs * 8)))
+
+
+def select_flights(csv_dir: str, mapping_data: dict, folder: str = None, classes: list = None) -> list:
+    # Flight files below folder (relative to csv_dir), and if classes are given
+    # only the flights annotated with one of them. Nothing else is listed
+    root = os.path.join(csv_dir, folder) if folder else csv_dir
+    rel_files = [os.path.join(folder, rel_file) if folder else rel_file for rel_file in list_flights(root)]
+    if classes:
+        rel_files = [rel_file for rel_file in rel_files
+                     if set(entry_classes(mapping_data.get(flight_key(rel_file), {}))) & set(classes)]
+    return rel_files
+
+
+def entry_classes(file_data: dict) -> list:
+    return [annotation['class'] for annotation in file_data.get('annotations', [])]
+
+
+def in_folder(key: str, folder: str = None) -> bool:
+    return not folder or key == folder or key.startswith(folder.rstrip("/") + "/")
+
+
+def flight_row(rel_file: str, summary: dict, mapping_data: dict) -> dict:
+    # Per-flight statistics: duration, time with valid data of every sensor
+    # family and of both families of an overlap, in seconds
+    key = flight_key(rel_file)
+    row = {"flight": key, "file": rel_file, "annotated": key in mapping_data,
+           "classes": sorted(set(entry_classes(mapping_data.get(key, {}))))}
+    if "error" in summary:
+        return {**row, "error": summary["error"]}
+    intervals = summary["intervals"]
+    return {
+        **row,
+        "duration_s": summary["duration"],
+        "rows": summary["rows"],
+        "intervals_from": summary["intervals_from"],
+        "sensors": {family: coverage(intervals[family]) / 1e6 for family in SENSOR_FAMILIES},
+        "overlaps": {name: coverage(intersection(intervals[first], intervals[second])) / 1e6
+                     for name, (first, second) in OVERLAPS.items()},
+    }
+
+
+def iter_flight_rows(csv_dir: str, mapping_data: dict, cache: dict, folder: str = None, classes: list = None,
+                     sensors: list = None, jobs: int = 1):
+    # Yield flight_row() of the selected flights as soon as each is computed.
+    # With sensors only flights with valid data of all of these families are kept
+    rel_files = select_flights(csv_dir, mapping_data, folder, classes)
+    for rel_file, summary in iter_summaries(csv_dir, rel_files, cache, jobs, prune=folder is None):
+        row = flight_row(rel_file, summary, mapping_data)
+        if sensors and "error" not in row and not all(row["sensors"][family] > 0 for family in sensors):
+            continue
+        yield row
+
+
+def build_report(rows: list, csv_dir: str, mapping_data: dict, cache: dict, folder: str = None,
+                 classes: list = None, sensors: list = None) -> dict:
+    # Totals over the flight rows and annotation statistics of the selected
+    # flights, as a json serializable report
+    def counter():
+        return {"duration_s": 0, "sensors": {family: 0 for family in SENSOR_FAMILIES},
+                "overlaps": {name: 0 for name in OVERLAPS}, "resampled_flights": 0}
+    totals, annotated = counter(), counter()
+    errors = []
+    durations = {}
+    for row in rows:
+        if "error" in row:
+            errors.append({"stage": "flight", "path": os.path.join(csv_dir, row["file"]), "error": row["error"]})
+            continue
+        durations[row["flight"]] = row["duration_s"]
+        for target in [totals, annotated] if row["annotated"] else [totals]:
+            target["duration_s"] += row["duration_s"]
+            for family in SENSOR_FAMILIES:
+                target["sensors"][family] += row["sensors"][family]
+            for name in OVERLAPS:
+                target["overlaps"][name] += row["overlaps"][name]
+            target["resampled_flights"] += row["intervals_from"] == "resampled"
+
+    # mapping.json entries of the selected flights, all of them without filters
+    selected = {row["flight"] for row in rows}
+    covered = {}
+    full_duration = {}
+    for file_path, aggregate in cached_aggregates(mapping_data, cache).items():
+        if not in_folder(file_path, folder) or (classes and not set(aggregate["classes"]) & set(classes)) \
+                or (sensors and file_path not in selected):
+            continue
+        names = [name for name in aggregate["classes"] if not classes or name in classes]
+        # Time covered by each class, overlapping ranges counted once
+        for name in names:
+            covered[name] = covered.get(name, 0) + aggregate["coverage"][name]
+
+        # Get the full file duration, flights of the listing were already read
+        if file_path not in durations:
+            summary = flight_summary(find_flight(csv_dir, file_path) or os.path.join(csv_dir, file_path + '.csv'))
+            if "error" in summary:
+                errors.append({"stage": "annotation", "path": file_path, "error": summary["error"]})
+                continue
+            durations[file_path] = summary["duration"]
+
+        # Add the duration once to each annotation class present in this file
+        for name in names:
+            full_duration[name] = full_duration.get(name, 0) + durations[file_path]
+
+    return {
+        "filters": {"folder": folder, "classes": classes, "sensors": sensors},
+        "flights": rows,
+        "totals": totals,
+        "annotated": annotated,
+        "annotation_classes": {name: {"covered_s": covered[name], "full_duration_s": full_duration.get(name)}
+                               for name in sorted(covered)},
+        "errors": errors,
+    }
+
+
+def compute_statistics(data_dir: str = DEFAULT_DATA_DIR, folder: str = None, classes: list = None,
+                       sensors: list = None, jobs: int = 1, use_cache: bool = True) -> dict:
+    # Report of the flights in data_dir/csv_files, see build_report()
+    csv_dir = os.path.join(data_dir, 'csv_files')
+    with open(os.path.join(data_dir, 'mapping.json'), 'r') as f:
+        mapping_data = json.load(f)
+    cache = load_cache(csv_dir) if use_cache else {"version": CACHE_VERSION, "flights": {}, "annotations": {}}
+    rows = list(iter_flight_rows(csv_dir, mapping_data, cache, folder, classes, sensors, jobs))
+    report = build_report(rows, csv_dir, mapping_data, cache, folder, classes, sensors)
+    save_cache(csv_dir, cache)
+    return report
+
+
+def percentage(value: float, total: float) -> float:
+    return (value / total) * 100 if total else 0.0
+
+
+def print_report(report: dict) -> None:
+    # Human readable report
+    for error in report["errors"]:
+        if error["stage"] == "flight":
+            print(f"Error processing {error['path']}: {error['error']}")
+
+    totals, annotated = report["totals"], report["annotated"]
+    print(f"Total flight duration: {format_duration(totals['duration_s'])} ({totals['duration_s']:.2f} seconds)")
+    for family in SENSOR_FAMILIES:
+        value = totals["sensors"][family]
+        print(f"{SENSOR_LABELS[family][0]} duration: {format_duration(value)} ({value:.2f} seconds)")
+
+    # Print overlap statistics
+    print()
+    for name in OVERLAPS:
+        value = totals["overlaps"][name]
+        print(f"{OVERLAP_LABELS[name]} overlap duration: {format_duration(value)} ({value:.2f} seconds)")
+    if totals["resampled_flights"]:
+        print(f"Note: the sensor durations of {totals['resampled_flights']} flights converted without topic spans "
+              f"include the time before a sensor started and after it stopped logging, convert them again")
+
+    # Print annotated statistics
+    print("\nAnnotated Files Statistics:")
+    value = annotated["duration_s"]
+    print(f"Annotated flight duration: {format_duration(value)} ({value:.2f} seconds)")
+    for family in SENSOR_FAMILIES:
+        value = annotated["sensors"][family]
+        print(f"Annotated {SENSOR_LABELS[family][1]} duration: {format_duration(value)} ({value:.2f} seconds)")
+
+    # Print annotated overlap statistics
+    print()
+    for name in OVERLAPS:
+        value = annotated["overlaps"][name]
+        print(f"Annotated {OVERLAP_LABELS[name]} overlap duration: {format_duration(value)} ({value:.2f} seconds)")
+
+    print("\nAnnotation Timestamps Statistics (from mapping.json):")
+    for error in report["errors"]:
+        if error["stage"] == "annotation":
+            print(f"Error processing {error['path']}: {error['error']}")
+    classes = report["annotation_classes"]
+
+    # Print full file duration statistics by annotation class
+    print("\nFull file duration statistics by annotation class:")
+    # classes whose flights could not be read have no full file duration
+    full_durations = {name: stats["full_duration_s"] for name, stats in classes.items()
+                      if stats["full_duration_s"] is not None}
+    total_full_duration = sum(full_durations.values())
+    print(f"\nTotal duration of files with annotations: {format_duration(total_full_duration)} ({total_full_duration:.2f} seconds)")
+    print("\nBy annotation class (full files):")
+    for class_name, duration in full_durations.items():
+        print(f"{class_name}: {format_duration(duration)} ({duration:.2f} seconds)")
+        print(f"Percentage of total annotated time: {percentage(duration, total_full_duration):.2f}%")
+
+    # Print annotation statistics from mapping.json timestamps
+    total_annotated_time = sum(stats["covered_s"] for stats in classes.values())
+    print(f"\nTotal time covered by annotations: {format_duration(total_annotated_time)} ({total_annotated_time:.2f} seconds)")
+    print("\nBy annotation class:")
+    for class_name, stats in classes.items():
+        duration = stats["covered_s"]
+        print(f"{class_name}: {format_duration(duration)} ({duration:.2f} seconds)")
+        print(f"Percentage of total flight time: {percentage(duration, total_annotated_time):.2f}%")
+
+
+# Columns of the per-flight table
+TABLE_COLUMNS = ["flight", "annotated", "classes", "duration_s", "rows", "intervals_from"] + \
+    [f"{family}_s" for family in SENSOR_FAMILIES] + [f"{name}_overlap_s" for name in OVERLAPS] + ["error"]
+
+
+def table_line(row: dict) -> str:
+    values = {
+        "flight": row["flight"], "annotated": int(row["annotated"]), "classes": ",".join(row["classes"]),
+        "duration_s": row.get("duration_s"), "rows": row.get("rows"), "error": row.get("error"),
+        "intervals_from": row.get("intervals_from"),
+        **{f"{family}_s": row.get("sensors", {}).get(family) for family in SENSOR_FAMILIES},
+        **{f"{name}_overlap_s": row.get("overlaps", {}).get(name) for name in OVERLAPS},
+    }
+    cells = [f"{value:.2f}" if isinstance(value, float) else "" if value is None else str(value)
+             for value in (values[column] for column in TABLE_COLUMNS)]
+    return "\t".join(cells)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flight, sensor and annotation durations of the converted flights')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR,
+                        help='Directory holding csv_files and mapping.json (default: ./data)')
+    parser.add_argument('--format', choices=['text', 'json', 'table', 'jsonl'], default='text',
+                        help='text report, json report, tab separated per-flight table, or one json '
+                             'line per flight followed by the report without the flights (default: text)')
+    parser.add_argument('--folder', default=None,
+                        help='Only flights below this folder of csv_files, e.g. 2024/site_a')
+    parser.add_argument('--class', dest='classes', action='append', default=None, metavar='CLASS',
+                        help='Only flights annotated with this class, and only this class in the annotation '
+                             'statistics; repeat for several classes')
+    parser.add_argument('--sensor', dest='sensors', action='append', default=None, choices=list(SENSOR_FAMILIES),
+                        help='Only flights with valid data of this sensor family; repeat to require several')
+    parser.add_argument('--jobs', type=int, default=0,
+                        help='Number of worker processes reading flights, 0 uses all cores (default: 0)')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help=f'Read every flight again instead of reusing the summaries cached in {CACHE_FILE}')
+    args = parser.parse_args()
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if args.format == 'text':
+        print_report(compute_statistics(args.data_dir, args.folder, args.classes, args.sensors, jobs,
+                                        not args.rebuild_cache))
+        return
+    if args.format == 'json':
+        print(json.dumps(compute_statistics(args.data_dir, args.folder, args.classes, args.sensors, jobs,
+                                            not args.rebuild_cache), indent=2))
+        return
+
+    # table and jsonl stream every flight as soon as it is computed
+    csv_dir = os.path.join(args.data_dir, 'csv_files')
+    with open(os.path.join(args.data_dir, 'mapping.json'), 'r') as f:
+        mapping_data = json.load(f)
+    cache = load_cache(csv_dir) if not args.rebuild_cache else {"version": CACHE_VERSION, "flights": {}, "annotations": {}}
+    if args.format == 'table':
+        print("\t".join(TABLE_COLUMNS), flush=True)
+    rows = []
+    for row in iter_flight_rows(csv_dir, mapping_data, cache, args.folder, args.classes, args.sensors, jobs):
+        rows.append(row)
+        print(table_line(row) if args.format == 'table' else json.dumps(row), flush=True)
+    report = build_report(rows, csv_dir, mapping_data, cache, args.folder, args.classes, args.sensors)
+    save_cache(csv_dir, cache)
+    if args.format == 'jsonl':
+        print(json.dumps({key: value for key, value in report.items() if key != "flights"}))
+
+
+if __name__ == "__main__":
+    main()
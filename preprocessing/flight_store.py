@@ -0,0 +1,97 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from urllib.parse import quote
+from typing import List
+from flight_io import atomic_output
+
+# Consolidated parquet store of all flights, next to csv_files in the data directory
+STORE_DIR = "flight_store"
+# Union of the columns of all converted flights, kept in the output directory
+SCHEMA_FILE = ".schema.json"
+# Hive partition column holding the flight key, one partition per flight
+PARTITION = "flight"
+
+
+def column_schema(df: pd.DataFrame) -> dict:
+    return {name: str(dtype) for name, dtype in df.dtypes.items()}
+
+
+def build_schema_registry(schemas: dict) -> dict:
+    # {"columns": {name: dtype}, "flights": {key: [names]}} from the {key: {name: dtype}}
+    # schemas of the flights. A column with different types in different flights
+    # gets the type all of them can be cast to, e.g. int8 and float32 give float32
+    columns = {}
+    for schema in schemas.values():
+        for name, dtype in schema.items():
+            columns[name] = str(np.result_type(columns[name], dtype)) if name in columns else dtype
+    return {
+        "columns": dict(sorted(columns.items())),
+        "flights": {key: sorted(schema) for key, schema in sorted(schemas.items())},
+    }
+
+
+def save_schema_registry(output_dir: str, registry: dict) -> None:
+    with atomic_output(os.path.join(output_dir, SCHEMA_FILE)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(registry, f, indent=2)
+
+
+def load_schema_registry(output_dir: str) -> dict:
+    path = os.path.join(output_dir, SCHEMA_FILE)
+    if not os.path.exists(path):
+        return {"columns": {}, "flights": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def flights_with(registry: dict, columns: List[str]) -> List[str]:
+    # Flights that have all of the columns, found without opening any of them
+    return [key for key, names in registry["flights"].items() if set(columns) <= set(names)]
+
+
+def partition_path(store_dir: str, key: str) -> str:
+    # flight keys contain folders, the partition value is uri encoded
+    return os.path.join(store_dir, f"{PARTITION}={quote(key, safe='')}")
+
+
+def write_store_partition(store_dir: str, key: str, df: pd.DataFrame) -> None:
+    # Replace the partition of a flight. The new partition is written to a hidden
+    # folder first, which dataset scans ignore, and then swapped in
+    target = partition_path(store_dir, key)
+    directory, name = os.path.split(target)
+    tmp_dir = os.path.join(directory, f".tmp-{os.getpid()}-{name}")
+    old_dir = os.path.join(directory, f".old-{os.getpid()}-{name}")
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        df.to_parquet(os.path.join(tmp_dir, "part-0.parquet"), index=False)
+        if os.path.exists(target):
+            os.rename(target, old_dir)
+        os.rename(tmp_dir, target)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def store_dataset(store_dir: str, registry: dict):
+    # pyarrow dataset over all partitions with the registry schema, so flights
+    # without some of the columns read them as nulls
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    fields = [pa.field(name, pa.from_numpy_dtype(np.dtype(dtype))) for name, dtype in registry["columns"].items()]
+    partitioning = ds.partitioning(pa.schema([(PARTITION, pa.string())]), flavor="hive")
+    return ds.dataset(store_dir, format="parquet", partitioning=partitioning,
+                      schema=pa.schema(fields + [pa.field(PARTITION, pa.string())]))
+
+
+def scan_store(store_dir: str, registry: dict, columns: List[str] = None, flights: List[str] = None) -> pd.DataFrame:
+    # Read the given columns of the given flights from the consolidated store in
+    # one scan. Only the partitions of the flights and the column chunks are read
+    import pyarrow.dataset as ds
+    dataset = store_dataset(store_dir, registry)
+    if columns is not None:
+        columns = [PARTITION] + [name for name in columns if name != PARTITION]
+    row_filter = ds.field(PARTITION).isin(flights) if flights is not None else None
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
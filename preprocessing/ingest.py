@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from flight_io import FLIGHT_FORMATS, write_flight_index
+from manifest import conversion_settings, load_manifest, save_manifest
+from triage import load_triage_report, save_triage_report
+from sources import source_stat
+from ulog2csv import (_convert_task, add_conversion_arguments, conversion_options, find_ulog_files, store_tasks,
+                      update_schema_registry)
+
+
+def changed_sources(tasks, keys, manifest, settings_for) -> dict:
+    # Sources whose size or mtime differ from the manifest, or that were converted
+    # with other settings, as {key: (ulog_path, output_loc, (size, mtime))}
+    changed = {}
+    for (ulog_path, output_loc), key in zip(tasks, keys):
+        try:
+            signature = source_stat(ulog_path)
+        except (FileNotFoundError, KeyError):
+            continue  # removed while walking
+        entry = manifest.get(key)
+        if entry and (entry["source"]["size"], entry["source"]["mtime"]) == signature \
+                and entry["settings"] == settings_for(output_loc):
+            continue
+        changed[key] = (ulog_path, output_loc, signature)
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch the ULog directory and convert new or changed logs '
+                                                 'as they land')
+    add_conversion_arguments(parser)
+    parser.add_argument('--interval', type=float, default=10.0,
+                        help='Seconds between two scans of the ULog directory (default: 10)')
+    parser.add_argument('--settle', type=float, default=30.0,
+                        help='Seconds a log must keep its size and mtime before it is converted, so files '
+                             'still being copied are left alone (default: 30)')
+    parser.add_argument('--data-dir', default=None,
+                        help='Directory holding ulg_files and csv_files (default: ../data next to this script)')
+    parser.add_argument('--once', action='store_true',
+                        help='Exit as soon as no log is waiting or being converted instead of watching')
+    args = parser.parse_args()
+    options, triage = conversion_options(parser, args)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.abspath(args.data_dir) if args.data_dir else os.path.join(cwd, "../data")
+    ulg_dir = os.path.join(data_dir, "ulg_files")
+    output_csv_dir = os.path.join(data_dir, "csv_files")
+    if not os.path.isdir(output_csv_dir):
+        os.makedirs(output_csv_dir)
+
+    manifest = load_manifest(output_csv_dir)
+    triage_report = load_triage_report(output_csv_dir)
+
+    def settings_for(output_loc):
+        return conversion_settings(output_loc, {**options, "triage": triage})
+
+    pending = {}  # key -> (signature, time the signature was first seen)
+    failed = {}  # key -> signature of a log that could not be converted
+    running = {}  # future -> (key, signature)
+    processed = 0
+    print(f"Watching {os.path.abspath(ulg_dir)} with {jobs} worker(s)")
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            now = time.monotonic()
+            tasks = find_ulog_files(ulg_dir, output_csv_dir, FLIGHT_FORMATS[args.format])
+            keys = [os.path.relpath(ulog_path, ulg_dir) for ulog_path, _ in tasks]
+            stores = dict(zip(keys, store_tasks(tasks, output_csv_dir, options.get("store", False))))
+            busy = {key for key, _ in running.values()}
+            for key, (ulog_path, output_loc, signature) in changed_sources(tasks, keys, manifest,
+                                                                           settings_for).items():
+                if key in busy or failed.get(key) == signature:
+                    continue
+                # debounce: wait until the file stopped changing for --settle seconds
+                if key not in pending or pending[key][0] != signature:
+                    pending[key] = (signature, now)
+                    continue
+                if now - pending[key][1] < args.settle or len(running) >= jobs:
+                    continue
+                del pending[key]
+                future = executor.submit(_convert_task, processed, ulog_path, output_loc, options, True,
+                                         manifest.get(key), False, triage, None, stores[key])
+                running[future] = (key, signature)
+                processed += 1
+
+            done = [future for future in running if future.done()]
+            for future in done:
+                key, signature = running.pop(future)
+                result = future.result()
+                print(f"{result['status'].capitalize()} {key}: {result['message']}")
+                if result["entry"] is not None:
+                    manifest[key] = result["entry"]
+                    failed.pop(key, None)
+                else:
+                    # not retried until the log changes again
+                    failed[key] = signature
+                if result["triage"] is not None:
+                    triage_report[key] = result["triage"]
+                elif result["status"] == "converted":
+                    triage_report.pop(key, None)
+            if done:
+                # publish the new state, the server picks up the index on its next poll
+                save_manifest(output_csv_dir, manifest)
+                save_triage_report(output_csv_dir, triage_report)
+                update_schema_registry(output_csv_dir, manifest, tasks, keys)
+                write_flight_index(output_csv_dir)
+
+            if args.once and not pending and not running:
+                break
+            time.sleep(args.interval if not running else min(args.interval, 1.0))
+
+
+if __name__ == "__main__":
+    main()
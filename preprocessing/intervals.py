@@ -0,0 +1,58 @@
+import numpy as np
+
+# Intervals are (n, 2) int64 arrays of [start, end] timestamps in microseconds.
+# All operations sort the interval endpoints once and sweep them with a
+# cumulative sum, so they are linear after sorting and have no Python loops
+
+
+def as_intervals(intervals) -> np.ndarray:
+    return np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+
+
+def covered_at_least(intervals, k: int = 1) -> np.ndarray:
+    # Sorted, disjoint intervals where at least k of the given intervals overlap.
+    # At equal timestamps starts are counted before ends, so touching intervals
+    # are merged by a union and give no intersection
+    intervals = as_intervals(intervals)
+    if len(intervals) == 0:
+        return intervals
+    positions = np.concatenate([intervals[:, 0], intervals[:, 1]])
+    deltas = np.concatenate([np.ones(len(intervals), dtype=np.int64), -np.ones(len(intervals), dtype=np.int64)])
+    order = np.lexsort((-deltas, positions))
+    positions = positions[order]
+    inside = np.cumsum(deltas[order]) >= k
+    was_inside = np.concatenate([[False], inside[:-1]])
+    runs = np.column_stack([positions[inside & ~was_inside], positions[~inside & was_inside]])
+    return runs if k == 1 else runs[runs[:, 1] > runs[:, 0]]
+
+
+def union(intervals) -> np.ndarray:
+    # Possibly overlapping intervals merged into sorted, disjoint ones
+    return covered_at_least(intervals, 1)
+
+
+def intersection(*interval_lists) -> np.ndarray:
+    # Time covered by every one of the interval lists
+    if not interval_lists:
+        return as_intervals([])
+    unions = [union(intervals) for intervals in interval_lists]
+    return covered_at_least(np.concatenate(unions), len(unions))
+
+
+def coverage(intervals) -> int:
+    # Total time covered by the intervals, overlaps are counted once
+    merged = union(intervals)
+    return int((merged[:, 1] - merged[:, 0]).sum())
+
+
+def mask_intervals(timestamp: np.ndarray, active: np.ndarray) -> np.ndarray:
+    # (start, end) timestamps of every run of active samples, a run lasts until
+    # the first sample that left the state, or until the last sample
+    active = np.asarray(active, dtype=bool)
+    if not active.any():
+        return as_intervals([])
+    edges = np.diff(active.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    timestamp = np.asarray(timestamp).astype(np.int64)
+    return np.column_stack([timestamp[starts], timestamp[np.minimum(ends, len(timestamp) - 1)]])
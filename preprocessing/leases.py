@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+
+# Lease files of running conversions, kept in the output directory
+LEASE_DIR = ".leases"
+# A lease whose file was not refreshed for this many seconds belongs to a crashed worker
+DEFAULT_TTL = 300
+
+
+def lease_path(lease_dir: str, key: str) -> str:
+    return os.path.join(lease_dir, hashlib.sha1(key.encode()).hexdigest() + ".lease")
+
+
+def _read_lease(path: str) -> dict | None:
+    # None once the lease is gone. A lease that was created but never written,
+    # e.g. by a worker that crashed right after creating it, has no owner or
+    # token but still expires through its mtime
+    try:
+        mtime = os.stat(path).st_mtime
+        with open(path, "r") as f:
+            lease = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        lease = {"owner": "another worker"}
+    lease["mtime"] = mtime
+    return lease
+
+
+class Lease:
+    """Exclusive claim on one source log, shared between hosts through the filesystem"""
+
+    def __init__(self, lease_dir: str, key: str, ttl: float = DEFAULT_TTL):
+        self.path = lease_path(lease_dir, key)
+        self.key = key
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.token = uuid.uuid4().hex
+        self.holder = None
+        # set by the heartbeat once another worker took the lease over
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        os.makedirs(lease_dir, exist_ok=True)
+
+    def _create(self) -> bool:
+        # O_CREAT | O_EXCL is atomic on local filesystems and NFSv3+
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump({"key": self.key, "owner": self.owner, "token": self.token, "ttl": self.ttl}, f)
+        return True
+
+    def _break_expired(self, lease: dict) -> None:
+        # Move the expired lease out of the way. Between reading it and the rename
+        # another worker may have replaced it, or its owner may have refreshed it,
+        # so the file actually moved is checked again and put back unless it is
+        # still the expired lease that was read. An unreadable lease is only
+        # broken once it is stale itself, so it is removed rather than put back.
+        # While it is moved aside a third worker can create its own lease, then
+        # the moved lease cannot be put back and two workers believe to hold the
+        # log. The owner of the lost lease notices it in its heartbeat, and as
+        # outputs are written atomically the worst case is a duplicate conversion
+        tombstone = f"{self.path}.{self.token}.expired"
+        try:
+            os.rename(self.path, tombstone)
+        except FileNotFoundError:
+            return
+        moved = _read_lease(tombstone)
+        if moved is None:
+            return
+        if moved.get("token") != lease.get("token") \
+                or time.time() - moved["mtime"] < moved.get("ttl", self.ttl):
+            try:
+                os.link(tombstone, self.path)
+            except FileExistsError:
+                pass
+        os.remove(tombstone)
+
+    def acquire(self) -> bool:
+        if self._create():
+            self._start_heartbeat()
+            return True
+        lease = _read_lease(self.path)
+        if lease is not None and time.time() - lease["mtime"] < lease.get("ttl", self.ttl):
+            self.holder = lease["owner"]
+            return False
+        if lease is not None:
+            print(f"Breaking expired lease of {lease['owner']} on {self.key}")
+            self._break_expired(lease)
+        if self._create():
+            self._start_heartbeat()
+            return True
+        lease = _read_lease(self.path)
+        self.holder = lease["owner"] if lease else "another worker"
+        return False
+
+    def is_held(self) -> bool:
+        if self.lost.is_set():
+            return False
+        lease = _read_lease(self.path)
+        return lease is not None and lease.get("token") == self.token
+
+    def _start_heartbeat(self) -> None:
+        # Refresh the lease mtime so a long conversion is not taken for a crash.
+        # The lease can be missing for a moment while another worker checks it
+        # in _break_expired(), refreshing stops only once another lease replaced
+        # it. The conversion then must not write its outputs, see is_held()
+        def beat():
+            while not self._stop.wait(self.ttl / 3):
+                lease = _read_lease(self.path)
+                if lease is None:
+                    continue
+                if lease.get("token") != self.token:
+                    print(f"Lease on {self.key} was taken over by {lease['owner']}")
+                    self.lost.set()
+                    return
+                try:
+                    os.utime(self.path)
+                except FileNotFoundError:
+                    continue
+        self._heartbeat = threading.Thread(target=beat, daemon=True)
+        self._heartbeat.start()
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        # only remove our own lease, it may have been broken and taken over
+        if self.is_held():
+            os.remove(self.path)
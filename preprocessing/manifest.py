@@ -0,0 +1,130 @@
+import os
+import json
+import hashlib
+from flight_io import PYRAMID_SUFFIX, atomic_output, metadata_path
+from sources import open_source, source_stat
+from derived import DERIVED_VERSION
+
+# Conversion manifest stored in the output directory
+MANIFEST_FILE = ".manifest.json"
+# Entries written by the workers of a sharded run, one file per source log
+ENTRY_DIR = ".manifest.d"
+# Bump when the conversion output changes for the same settings, so that every
+# flight is converted again on the next incremental run
+CONVERTER_VERSION = 8
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    # sha256 of a file, or of the decompressed ULog data of a source
+    digest = hashlib.sha256()
+    with open_source(path) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_signature(path: str, previous: dict = None) -> dict:
+    # Size, mtime and hash of a source log. The hash of the previous run is
+    # reused when size and mtime did not change, so unchanged files are not read.
+    # Compressed logs and archive members are hashed by their ULog content
+    size, mtime = source_stat(path)
+    signature = {"size": size, "mtime": mtime}
+    if previous and previous.get("size") == signature["size"] and previous.get("mtime") == signature["mtime"]:
+        signature["sha256"] = previous["sha256"]
+    else:
+        signature["sha256"] = file_digest(path)
+    return signature
+
+
+def conversion_settings(output_loc: str, options: dict) -> dict:
+    # Everything that changes the produced files, besides the source log itself
+    return {
+        "converter_version": CONVERTER_VERSION,
+        "derived_version": DERIVED_VERSION,
+        "extension": os.path.splitext(output_loc)[1],
+        **{key: value for key, value in options.items() if key != "skip_processed"},
+    }
+
+
+def output_files(output_loc: str) -> list:
+    # The flight file and its sidecars
+    candidates = [output_loc, metadata_path(output_loc), output_loc + PYRAMID_SUFFIX]
+    return [path for path in candidates if os.path.exists(path)]
+
+
+def output_checksums(output_loc: str) -> dict:
+    return {
+        os.path.basename(path): {"size": os.path.getsize(path), "sha256": file_digest(path)}
+        for path in output_files(output_loc)
+    }
+
+
+def is_up_to_date(entry: dict, source: dict, settings: dict, output_loc: str) -> bool:
+    # A flight is up to date when the same source was converted with the same
+    # settings and all recorded outputs are still in place
+    if not entry or entry["source"]["sha256"] != source["sha256"] or entry["settings"] != settings:
+        return False
+    directory = os.path.dirname(output_loc)
+    for name, output in entry.get("outputs", {}).items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path) or os.path.getsize(path) != output["size"]:
+            return False
+    return True
+
+
+def _entry_path(output_dir: str, key: str) -> str:
+    return os.path.join(output_dir, ENTRY_DIR, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+
+def _read_json(path: str) -> dict | None:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_manifest_entry(output_dir: str, key: str, entry: dict) -> None:
+    # Sharded workers on several hosts can not safely rewrite one shared
+    # manifest, so each of them stores its entries in separate files
+    path = _entry_path(output_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "entry": entry}, f, indent=2, sort_keys=True)
+
+
+def load_manifest_entry(output_dir: str, key: str) -> dict | None:
+    # The current entry of one source log, possibly written by another host
+    stored = _read_json(_entry_path(output_dir, key))
+    if stored is not None:
+        return stored["entry"]
+    return load_manifest(output_dir, merge_entries=False).get(key)
+
+
+def _entry_files(output_dir: str) -> list:
+    entry_dir = os.path.join(output_dir, ENTRY_DIR)
+    if not os.path.isdir(entry_dir):
+        return []
+    return [os.path.join(entry_dir, name) for name in os.listdir(entry_dir) if name.endswith(".json")]
+
+
+def load_manifest(output_dir: str, merge_entries: bool = True) -> dict:
+    manifest = _read_json(os.path.join(output_dir, MANIFEST_FILE)) or {}
+    if merge_entries:
+        for path in _entry_files(output_dir):
+            stored = _read_json(path)
+            if stored is not None:
+                manifest[stored["key"]] = stored["entry"]
+    return manifest
+
+
+def save_manifest(output_dir: str, manifest: dict) -> None:
+    with atomic_output(os.path.join(output_dir, MANIFEST_FILE)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    # entry files that are now part of the manifest are no longer needed
+    for path in _entry_files(output_dir):
+        stored = _read_json(path)
+        if stored is not None and manifest.get(stored["key"]) == stored["entry"]:
+            os.remove(path)
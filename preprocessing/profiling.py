@@ -0,0 +1,97 @@
+import os
+import time
+import numpy as np
+from contextlib import contextmanager
+from typing import List
+
+
+def reset_peak_rss() -> bool:
+    # Reset the high-water mark of the process so the next peak_rss_mb() only
+    # covers what follows. Linux only, returns False where it is not supported
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float | None:
+    # High-water mark since the last reset_peak_rss(), or the start of the process
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def current_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class StageProfiler:
+    """Wall time, CPU time and memory per conversion stage of one file"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        # the peak is only per stage where the high-water mark can be reset,
+        # elsewhere it would include earlier stages and files of the worker
+        reset = reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": time.process_time() - cpu,
+                "rss_mb": current_rss_mb(),
+                "peak_rss_mb": peak_rss_mb() if reset else None,
+            }
+
+    def count(self, **counters) -> None:
+        self.counters.update(counters)
+
+    def to_record(self, path: str, status: str) -> dict:
+        return {
+            "file": path,
+            "status": status,
+            "total_wall_s": sum(stage["wall_s"] for stage in self.stages.values()),
+            "stages": self.stages,
+            **self.counters,
+        }
+
+
+def print_profile_summary(records: List[dict], slowest: int = 10) -> None:
+    # p50/p95 per stage over all converted files and the slowest files
+    records = [record for record in records if record["status"] == "converted"]
+    if not records:
+        return
+    print("\nProfile (converted files):")
+    stage_names = list(dict.fromkeys(name for record in records for name in record["stages"]))
+    for name in stage_names:
+        wall = np.array([record["stages"][name]["wall_s"] for record in records if name in record["stages"]])
+        print(f"{name:>22}: p50 {np.percentile(wall, 50):8.3f}s  p95 {np.percentile(wall, 95):8.3f}s  "
+              f"total {wall.sum():9.2f}s")
+    peak = [stage["peak_rss_mb"] for record in records for stage in record["stages"].values()
+            if stage["peak_rss_mb"] is not None]
+    if peak:
+        print(f"{'stage peak rss':>22}: p50 {np.percentile(peak, 50):8.1f}MB p95 {np.percentile(peak, 95):8.1f}MB")
+    written = sum(record.get("bytes_written", 0) for record in records)
+    print(f"{'bytes written':>22}: {written / 2**20:.1f}MB")
+
+    print("\nSlowest files:")
+    for record in sorted(records, key=lambda record: record["total_wall_s"], reverse=True)[:slowest]:
+        slowest_stage = max(record["stages"], key=lambda name: record["stages"][name]["wall_s"])
+        print(f"{record['total_wall_s']:8.2f}s {record['file']} (slowest stage: {slowest_stage}, "
+              f"{record.get('rows', 0)} rows, {record.get('columns', 0)} columns)")
@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import pandas as pd
+from flight_io import PYRAMID_SUFFIX, atomic_output
+from field_types import field_kind
+
+# Level k aggregates 2**k rows per bucket
+FIRST_LEVEL = 4
+# Stop adding levels once a level has fewer buckets than this
+MIN_BUCKETS = 256
+# Per-bucket arrays stored for every level
+LEVEL_ARRAYS = ("timestamp_start", "timestamp_end", "first", "last", "min", "min_time", "max", "max_time")
+
+
+def pyramid_path(path: str) -> str:
+    return path + PYRAMID_SUFFIX
+
+
+def flight_signature(path: str) -> np.ndarray:
+    # size and mtime of the flight file a pyramid was built from
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def remove_pyramid(path: str) -> None:
+    # The pyramid of a previous conversion does not match a flight that is
+    # rewritten without one or skipped
+    if os.path.exists(pyramid_path(path)):
+        os.remove(pyramid_path(path))
+
+
+def _grouped(array, factor):
+    # (buckets, factor, ...) view of array, the last bucket padded with NaN
+    pad = -len(array) % factor
+    if pad:
+        array = np.concatenate([array, np.full((pad,) + array.shape[1:], np.nan)])
+    return array.reshape(-1, factor, *array.shape[1:])
+
+
+def _select(values, times, factor, pick, nan_fill):
+    # Reduce every `factor` consecutive buckets to the extreme chosen by pick,
+    # ignoring NaN, together with the timestamp that extreme occurred at
+    values, times = _grouped(values, factor), _grouped(times, factor)
+    idx = pick(np.where(np.isnan(values), nan_fill, values), axis=1)[:, None]
+    return np.take_along_axis(values, idx, axis=1)[:, 0], np.take_along_axis(times, idx, axis=1)[:, 0]
+
+
+def _reduce_level(timestamp_start, timestamp_end, first, last, minimum, min_time, maximum, max_time, factor):
+    # Merge every `factor` consecutive buckets into one
+    starts = np.arange(0, len(timestamp_start), factor)
+    ends = np.minimum(starts + factor, len(timestamp_start)) - 1
+    return (
+        timestamp_start[starts],
+        timestamp_end[ends],
+        first[starts],
+        last[ends],
+        *_select(minimum, min_time, factor, np.argmin, np.inf),
+        *_select(maximum, max_time, factor, np.argmax, -np.inf),
+    )
+
+
+def build_pyramid(df: pd.DataFrame) -> dict:
+    # min/max (with the time they occur at)/first/last of every column per
+    # bucket at power-of-two decimation levels
+    columns = [col for col in df.columns if col != "timestamp"]
+    timestamp = df["timestamp"].to_numpy(dtype=np.float64)
+    values = df[columns].to_numpy(dtype=np.float64)
+    times = np.broadcast_to(timestamp[:, None], values.shape)
+
+    pyramid = {"columns": np.array(columns), "rows": np.array(len(df))}
+    level = (timestamp, timestamp, values, values, values, times, values, times)
+    factor = 2 ** FIRST_LEVEL
+    k = FIRST_LEVEL
+    while len(level[0]) > MIN_BUCKETS:
+        level = _reduce_level(*level, factor)
+        for name, array in zip(LEVEL_ARRAYS, level):
+            pyramid[f"L{k}.{name}"] = array
+        # every further level halves the number of buckets
+        factor = 2
+        k += 1
+    return pyramid
+
+
+def write_pyramid(df: pd.DataFrame, path: str) -> None:
+    # written after the flight file, whose signature it records
+    with atomic_output(pyramid_path(path)) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, flight=flight_signature(path), **build_pyramid(df))
+
+
+def load_pyramid_level(path: str, max_buckets: int) -> pd.DataFrame | None:
+    # Load the finest level with at most max_buckets buckets, expanded to
+    # four points per bucket. Returns None when the pyramid is missing, was
+    # built from another version of the flight file or the full resolution
+    # flight is small enough to plot as is
+    lod_path = pyramid_path(path)
+    if not os.path.exists(lod_path):
+        return None
+    with np.load(lod_path) as pyramid:
+        if "flight" not in pyramid.files or not np.array_equal(pyramid["flight"], flight_signature(path)):
+            return None
+        if int(pyramid["rows"]) <= 4 * max_buckets:
+            return None
+        levels = sorted(int(name[1:].split(".")[0]) for name in pyramid.files if name.endswith(".min_time"))
+        if not levels:
+            # pyramids written without min_time/max_time are rebuilt on the next conversion
+            return None
+        fitting = [k for k in levels if len(pyramid[f"L{k}.timestamp_start"]) <= max_buckets]
+        k = fitting[0] if fitting else levels[-1]
+
+        columns = list(pyramid["columns"])
+        start = pyramid[f"L{k}.timestamp_start"]
+        end = pyramid[f"L{k}.timestamp_end"]
+        first, last = pyramid[f"L{k}.first"], pyramid[f"L{k}.last"]
+        minimum, maximum = pyramid[f"L{k}.min"], pyramid[f"L{k}.max"]
+        min_first = pyramid[f"L{k}.min_time"] <= pyramid[f"L{k}.max_time"]
+
+    # min and max go in the order they occur within the bucket
+    second = np.where(min_first, minimum, maximum)
+    third = np.where(min_first, maximum, minimum)
+    # a discrete field only holds values it actually had, a min/max pair in
+    # between would draw mode changes that never happened
+    discrete = np.array([field_kind(*col.split(".", 1)) == "discrete" if "." in col else False for col in columns],
+                        dtype=bool)
+    second[:, discrete] = first[:, discrete]
+    third[:, discrete] = last[:, discrete]
+
+    step = (end - start) / 3
+    timestamp = np.column_stack([start, start + step, end - step, end]).ravel()
+    # interleave the four points of each bucket in time order
+    values = np.stack([first, second, third, last], axis=1).reshape(-1, len(columns))
+    df = pd.DataFrame(values, columns=columns, copy=False)
+    df.insert(0, "timestamp", timestamp)
+    return df
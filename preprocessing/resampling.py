@@ -0,0 +1,163 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from field_types import field_kind
+
+
+def interpolation_weights(x: np.ndarray, xp: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Left sample index and weight of the right sample for every x, values
+    # outside of xp are clamped to the first/last sample like np.interp
+    xp = np.asarray(xp, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    if len(xp) < 2:
+        return np.zeros(len(x), dtype=np.intp), np.zeros(len(x))
+
+    idx = np.searchsorted(xp, x, side='right') - 1
+    np.clip(idx, 0, len(xp) - 2, out=idx)
+    left = xp[idx]
+    span = xp[idx + 1] - left
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(span > 0, (x - left) / span, 0.0)
+    np.clip(weights, 0.0, 1.0, out=weights)
+    return idx, weights
+
+
+def hold_indices(x: np.ndarray, xp: np.ndarray) -> np.ndarray:
+    # Index of the last sample at or before every x, -1 before the first sample
+    return np.searchsorted(np.asarray(xp, dtype=np.float64), np.asarray(x, dtype=np.float64), side='right') - 1
+
+
+def interpolate_block(block: np.ndarray, idx: np.ndarray, weights: np.ndarray, out: np.ndarray) -> None:
+    # Linear interpolation of all columns of a (samples, fields) block at once
+    if block.shape[0] < 2:
+        out[:] = block[0] if block.shape[0] else np.nan
+        return
+    lower = block[idx]
+    np.subtract(block[idx + 1], lower, out=out)
+    out *= weights[:, None]
+    out += lower
+
+
+def group_by_timestamp(cols: List[dict]) -> Dict[int, List[int]]:
+    # Fields of one topic share the same timestamp array object
+    groups = {}
+    for position, col in enumerate(cols):
+        groups.setdefault(id(col["timestamp"]), []).append(position)
+    return groups
+
+
+def resample_columns(cols: List[dict], timeline: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    # Interpolate every column onto timeline, writing into out (samples, columns)
+    if out is None:
+        out = np.empty((len(timeline), len(cols)), order='F')
+
+    for positions in group_by_timestamp(cols).values():
+        timestamp = cols[positions[0]]["timestamp"]
+        idx, weights = interpolation_weights(timeline, timestamp)
+        block = np.column_stack([cols[p]["values"] for p in positions]).astype(np.float64, copy=False)
+        # columns of a topic are contiguous when they come from extract_topics
+        if positions == list(range(positions[0], positions[-1] + 1)):
+            interpolate_block(block, idx, weights, out[:, positions[0]:positions[-1] + 1])
+        else:
+            target = np.empty((len(timeline), len(positions)))
+            interpolate_block(block, idx, weights, target)
+            out[:, positions] = target
+    return out
+
+
+def resampled_dtype(values: np.ndarray, float32: bool = False) -> np.dtype:
+    # Integer and boolean fields (states, enums, flags) keep their narrow type,
+    # floats are widened to float64 unless float32 is set, in which case they
+    # keep their source precision. Empty columns can only be filled with NaN
+    values = np.asarray(values)
+    if values.dtype.kind in "biu" and values.size:
+        return values.dtype
+    if float32 and values.dtype.kind == "f" and values.dtype.itemsize <= 4:
+        return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+
+def hold_block(block: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    # Zero-order hold: the last sample at or before each point, the first
+    # sample before the topic starts so that integer columns need no NaN
+    return block[np.clip(idx, 0, len(block) - 1)]
+
+
+def unwrap_angles(values: np.ndarray) -> np.ndarray:
+    # Remove the jumps of 2*pi between samples, NaN samples are left out
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    unwrapped = values.copy()
+    unwrapped[finite] = np.unwrap(values[finite])
+    return unwrapped
+
+
+def wrap_angles(values: np.ndarray) -> None:
+    # Back into [-pi, pi), in place
+    values += np.pi
+    np.mod(values, 2 * np.pi, out=values)
+    values -= np.pi
+
+
+def resample_typed(cols: List[dict], timeline: np.ndarray, float32: bool = False) -> List[np.ndarray]:
+    # Like resample_columns, but returns one array per column with the type of
+    # resampled_dtype(). Continuous fields are interpolated, only one topic is
+    # held as a float64 block at a time. Discrete fields (states, modes, flags)
+    # are held instead, so they only ever take values that were logged, and
+    # wrapping angles are interpolated unwrapped
+    out = [None] * len(cols)
+    for positions in group_by_timestamp(cols).values():
+        timestamp = cols[positions[0]]["timestamp"]
+        kinds = {p: field_kind(cols[p].get("dataset", ""), cols[p].get("attr", ""), cols[p]["values"])
+                 for p in positions}
+
+        discrete = [p for p in positions if kinds[p] == "discrete"]
+        if discrete:
+            idx = hold_indices(timeline, timestamp)
+            for p in discrete:
+                out[p] = hold_block(np.asarray(cols[p]["values"]), idx).astype(
+                    resampled_dtype(cols[p]["values"], float32), copy=False)
+
+        continuous = [p for p in positions if kinds[p] != "discrete"]
+        if not continuous:
+            continue
+        idx, weights = interpolation_weights(timeline, timestamp)
+        block = np.column_stack([unwrap_angles(cols[p]["values"]) if kinds[p] == "angle" else cols[p]["values"]
+                                 for p in continuous]).astype(np.float64, copy=False)
+        resampled = np.empty((len(timeline), len(continuous)), order='F')
+        interpolate_block(block, idx, weights, resampled)
+        for j, p in enumerate(continuous):
+            dtype = resampled_dtype(cols[p]["values"], float32)
+            column = resampled[:, j]
+            if kinds[p] == "angle":
+                wrap_angles(column)
+            if dtype.kind in "biu":
+                np.rint(column, out=column)
+            # float64 columns stay views into the block, the rest is cast
+            out[p] = column.astype(dtype, copy=False)
+    return out
+
+
+def centroid_index(cols: List[dict]) -> int:
+    # The column whose length is closest to the median is used as the timeline
+    timestamps_len = np.array([len(col["timestamp"]) for col in cols])
+    median_len = np.median(timestamps_len)
+    return int(np.argmin(np.abs(timestamps_len - median_len)))
+
+
+def align_columns(cols: List[dict], grid: np.ndarray, method: str = "interp") -> np.ndarray:
+    # Align columns sampled at their native rates onto any requested grid.
+    # "interp" interpolates linearly, "asof" takes the last sample at or before
+    # each grid point (NaN before a topic's first sample)
+    if method == "interp":
+        return resample_columns(cols, grid)
+    if method != "asof":
+        raise ValueError(f"Unknown alignment method: {method}")
+
+    out = np.empty((len(grid), len(cols)), order='F')
+    for positions in group_by_timestamp(cols).values():
+        idx = hold_indices(grid, cols[positions[0]]["timestamp"])
+        valid = idx >= 0
+        for p in positions:
+            out[:, p] = np.nan
+            out[valid, p] = cols[p]["values"][idx[valid]]
+    return out
@@ -0,0 +1,65 @@
+import numpy as np
+from typing import List
+from resampling import group_by_timestamp
+from intervals import as_intervals, intersection, mask_intervals, union
+
+# vehicle_status.arming_state of an armed vehicle
+ARMING_STATE_ARMED = 2
+# Segment criteria: topic, field and the test of the in-segment state
+SEGMENT_CRITERIA = {
+    "armed": ("vehicle_status", "arming_state", lambda values: values == ARMING_STATE_ARMED),
+    "airborne": ("vehicle_land_detected", "landed", lambda values: values == 0),
+}
+NAV_STATE_TOPIC = "vehicle_status"
+
+
+def segment_topics(segments: dict) -> List[str]:
+    # Topics the parser must decode to find the segments
+    topics = [SEGMENT_CRITERIA[name][0] for name in segments["criteria"]]
+    if segments.get("nav_states"):
+        topics.append(NAV_STATE_TOPIC)
+    return list(dict.fromkeys(topics))
+
+
+def find_segments(ulog, segments: dict) -> np.ndarray | str:
+    # Intervals in which all segment criteria hold, widened by the padding.
+    # Returns the name of a missing topic when a criterion can not be evaluated
+    conditions = [SEGMENT_CRITERIA[name] for name in segments["criteria"]]
+    if segments.get("nav_states"):
+        nav_states = np.asarray(segments["nav_states"])
+        conditions.append((NAV_STATE_TOPIC, "nav_state", lambda values: np.isin(values, nav_states)))
+
+    found = []
+    for topic, field, test in conditions:
+        try:
+            data = ulog.get_dataset(topic).data
+        except (KeyError, IndexError, ValueError):
+            return topic
+        if field not in data:
+            return f"{topic}.{field}"
+        found.append(mask_intervals(data["timestamp"], test(data[field])))
+    result = intersection(*found)
+    if len(result) == 0:
+        return as_intervals([])
+
+    padding = int(segments.get("padding_s", 0) * 1e6)
+    return union(result + np.array([-padding, padding]))
+
+
+def slice_columns(cols: List[dict], intervals: np.ndarray) -> List[dict]:
+    # Keep only the samples inside the intervals. Fields of a topic keep sharing
+    # one timestamp array, columns left without samples are dropped
+    sliced = []
+    for positions in group_by_timestamp(cols).values():
+        timestamp = np.asarray(cols[positions[0]]["timestamp"])
+        # compare as int64, mixing uint64 and int64 would go through float64
+        microseconds = timestamp.astype(np.int64)
+        inside = np.searchsorted(intervals[:, 0], microseconds, side='right') - 1
+        mask = inside >= 0
+        mask[mask] = microseconds[mask] <= intervals[inside[mask], 1]
+        if not mask.any():
+            continue
+        kept = timestamp[mask]
+        for p in positions:
+            sliced.append((p, {**cols[p], "timestamp": kept, "values": np.asarray(cols[p]["values"])[mask]}))
+    return [col for _, col in sorted(sliced, key=lambda item: item[0])]
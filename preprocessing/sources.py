@@ -0,0 +1,221 @@
+import io
+import os
+import gzip
+import tarfile
+import zipfile
+from typing import List, Tuple
+
+try:
+    import zstandard
+except ImportError:  # .zst inputs need `pip3 install zstandard`
+    zstandard = None
+
+# Single ULog files, plain or compressed
+ULOG_SUFFIXES = (".ulg", ".ulg.gz", ".ulg.zst")
+# Batches of logs, every .ulg member is converted
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+# Archive members are addressed as "archive.zip::folder/flight.ulg"
+MEMBER_SEPARATOR = "::"
+# How far the ULog parser may seek back in a decompressed stream, it only
+# steps back over the last message (at most 64 KiB) when resynchronizing
+HISTORY_BYTES = 1 << 20
+READ_SIZE = 1 << 18
+
+# Member listings by (archive, size, mtime)
+_members = {}
+
+
+class RewindableReader(io.RawIOBase):
+    """Forward-only stream that keeps the last history bytes, so short backward seeks work"""
+
+    def __init__(self, reopen, history: int = HISTORY_BYTES, owners=()):
+        super().__init__()
+        self._reopen = reopen
+        self._raw = reopen()
+        self._owners = owners
+        self._history = history
+        self._buffer = bytearray()
+        self._start = 0  # stream offset of self._buffer[0]
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def _fill(self, end: int) -> None:
+        # read from the raw stream until the buffer reaches stream offset end
+        while self._start + len(self._buffer) < end:
+            chunk = self._raw.read(max(READ_SIZE, end - self._start - len(self._buffer)))
+            if not chunk:
+                break
+            self._buffer += chunk
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            self._buffer += self._raw.read()
+            size = self._start + len(self._buffer) - self._pos
+        self._fill(self._pos + size)
+        begin = self._pos - self._start
+        data = bytes(self._buffer[begin:begin + size])
+        self._pos += len(data)
+        # drop what is out of reach, in large steps to avoid moving the buffer too often
+        excess = self._pos - self._start - self._history
+        if excess > READ_SIZE:
+            del self._buffer[:excess]
+            self._start += excess
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            target = offset
+        elif whence == io.SEEK_CUR:
+            target = self._pos + offset
+        else:
+            raise io.UnsupportedOperation("can not seek relative to the end of a stream")
+        if target < self._start:
+            self._restart(target)
+        self._fill(target)
+        self._pos = target
+        return self._pos
+
+    def _restart(self, target: int) -> None:
+        # Decompress again from the start and skip to target. Only needed when
+        # the parser searched a log without sync markers to its end for a sync
+        # after a corruption and goes back to where it started
+        self._raw.close()
+        self._raw = self._reopen()
+        self._buffer = bytearray()
+        self._start = 0
+        while self._start + READ_SIZE <= target:
+            chunk = self._raw.read(READ_SIZE)
+            if not chunk:
+                break
+            self._start += len(chunk)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        if not self.closed:
+            self._raw.close()
+            for owner in self._owners:
+                owner.close()
+        super().close()
+
+
+class ClosingGzipFile(gzip.GzipFile):
+    """GzipFile that also closes the compressed stream it reads from"""
+
+    def __init__(self, fileobj):
+        super().__init__(fileobj=fileobj, mode="rb")
+        self._source = fileobj
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._source.close()
+
+
+def is_source_file(file: str) -> bool:
+    return file.endswith(ULOG_SUFFIXES) or file.endswith(ARCHIVE_SUFFIXES)
+
+
+def split_source(source: str) -> Tuple[str, str | None]:
+    path, _, member = source.partition(MEMBER_SEPARATOR)
+    return path, member or None
+
+
+def _strip_suffix(name: str, suffixes: tuple) -> str:
+    for suffix in sorted(suffixes, key=len, reverse=True):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def source_stem(source: str) -> str:
+    # Output name of a source without extension, relative to the source's folder.
+    # Archive members keep their folders below a folder named after the archive
+    path, member = split_source(source)
+    name = _strip_suffix(os.path.basename(path), ARCHIVE_SUFFIXES if member else ULOG_SUFFIXES)
+    if member is None:
+        return name
+    # never leave the output directory, whatever the member names are
+    parts = [part for part in _strip_suffix(member, ULOG_SUFFIXES).split("/") if part not in ("", ".", "..")]
+    return os.path.join(name, *parts)
+
+
+def source_name(source: str) -> str:
+    # Short name stored in the flight metadata, e.g. batch.zip::folder/flight.ulg
+    path, member = split_source(source)
+    return os.path.basename(path) + (MEMBER_SEPARATOR + member if member else "")
+
+
+def _archive_members(path: str) -> dict:
+    # {member: size} of the ULog members of an archive, cached by archive size
+    # and mtime since listing a compressed tar decompresses all of it
+    stat = os.stat(path)
+    cache_key = (path, stat.st_size, stat.st_mtime)
+    if cache_key not in _members:
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                members = {info.filename: info.file_size for info in archive.infolist() if not info.is_dir()}
+        else:
+            with tarfile.open(path, "r:*") as archive:
+                members = {member.name: member.size for member in archive if member.isfile()}
+        _members[cache_key] = {name: size for name, size in sorted(members.items())
+                               if name.endswith(ULOG_SUFFIXES)}
+    return _members[cache_key]
+
+
+def list_sources(path: str) -> List[str]:
+    # ULog sources in a file: the file itself, or the ULog members of an archive.
+    # An archive that can not be read yet (e.g. still being copied) has none
+    if not path.endswith(ARCHIVE_SUFFIXES):
+        return [path] if path.endswith(ULOG_SUFFIXES) else []
+    try:
+        members = _archive_members(path)
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError) as error:
+        print(f"Could not read archive {path}: {error}")
+        return []
+    return [path + MEMBER_SEPARATOR + member for member in members]
+
+
+def source_stat(source: str) -> Tuple[int, float]:
+    # (size, mtime) used to notice changed sources, archive members are
+    # considered changed whenever the archive itself changes
+    path, member = split_source(source)
+    stat = os.stat(path)
+    if member is None:
+        return stat.st_size, stat.st_mtime
+    return _archive_members(path)[member], stat.st_mtime
+
+
+def _decompress(open_raw, name: str, owners=()) -> RewindableReader:
+    # Rewindable reader of a .ulg, .ulg.gz or .ulg.zst stream, open_raw()
+    # opens the compressed stream again from its start
+    if name.endswith(".gz"):
+        return RewindableReader(lambda: ClosingGzipFile(open_raw()), owners=owners)
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"{name} needs zstandard, install it with 'pip3 install zstandard'")
+        return RewindableReader(lambda: zstandard.ZstdDecompressor().stream_reader(open_raw(), closefd=True),
+                                owners=owners)
+    return RewindableReader(open_raw, owners=owners)
+
+
+def open_source(source: str):
+    # Readable binary stream of the ULog data of a source, decompressed on the
+    # fly. Uncompressed files are opened directly and are fully seekable
+    path, member = split_source(source)
+    if member is None:
+        if not path.endswith((".gz", ".zst")):
+            return open(path, "rb")
+        return _decompress(lambda: open(path, "rb"), path)
+    if path.endswith(".zip"):
+        archive = zipfile.ZipFile(path)
+        return _decompress(lambda: archive.open(member), member, owners=(archive,))
+    archive = tarfile.open(path, "r:*")
+    return _decompress(lambda: archive.extractfile(member), member, owners=(archive,))
@@ -0,0 +1,23 @@
+import numpy as np
+from resampling import resample_typed
+
+
+def angle_column(dataset, attr):
+    # yaw logged at 3.1, -3.1, -3.0 rad crosses the ±π wrap between the first two samples
+    return {"dataset": dataset, "attr": attr, "timestamp": np.array([0, 10, 20]),
+            "values": np.array([3.1, -3.1, -3.0], dtype=np.float32)}
+
+
+def test_yaw_fields_are_interpolated_across_the_wrap():
+    timeline = np.array([5, 15])
+    cols = [angle_column("vehicle_local_position", "yaw"), angle_column("trajectory_setpoint", "yaw"),
+            angle_column("vehicle_attitude_setpoint", "yaw_body")]
+    for resampled in resample_typed(cols, timeline):
+        # the short way around passes ±π, not 0
+        assert abs(abs(resampled[0]) - np.pi) < 1e-3
+        assert np.isclose(resampled[1], -3.05, atol=1e-6)
+
+
+def test_other_fields_are_interpolated_linearly():
+    resampled, = resample_typed([angle_column("vehicle_local_position", "vx")], np.array([5]))
+    assert np.isclose(resampled[0], 0.0, atol=1e-6)
@@ -0,0 +1,147 @@
+import os
+import json
+import struct
+from typing import List, Tuple
+from flight_io import atomic_output
+from sources import open_source, source_stat
+
+# Triage report of rejected logs stored in the output directory
+TRIAGE_FILE = ".triage.json"
+ULOG_MAGIC = b"ULog\x01\x12\x35"
+# Message types of the ULog format, anything else means the file is corrupt
+MESSAGE_TYPES = set(b"FDIMPQARSOLCB")
+# The existing conversion skips flights whose timeline has fewer rows than this
+MIN_MESSAGES = 100
+
+# Bytes read at once while scanning
+CHUNK_SIZE = 1 << 20
+
+_message_header = struct.Struct("<HB")
+_msg_id = struct.Struct("<H")
+_timestamp = struct.Struct("<Q")
+
+
+def scan_ulog(path: str, is_usable=None) -> dict:
+    # Walk the message headers of a ULog source without decoding any data.
+    # Counts the data messages of every logged topic (first instance only, like
+    # ULog.get_dataset) and estimates the duration from the first and last data
+    # timestamps. The source is read in chunks, so compressed logs and archive
+    # members are scanned as streams. Stops at the first corrupt message header,
+    # or as soon as is_usable(scan) accepts the partial scan, so good logs are
+    # only read until they are known to be good
+    scan = {"size": source_stat(path)[0], "error": None, "corrupt_offset": None, "complete": True,
+            "duration_s": 0.0, "topics": {}}
+    formats = {}  # topic name -> first field is the uint64 timestamp
+    subscriptions = {}  # msg_id -> topic name of instance 0
+    counts, first, last = {}, {}, {}
+
+    def summarize():
+        for msg_id, name in subscriptions.items():
+            scan["topics"][name] = counts.get(msg_id, 0)
+        if first:
+            scan["duration_s"] = (max(last.values()) - min(first.values())) / 1e6
+
+    with open_source(path) as f:
+        header = f.read(16)
+        if len(header) < 16:
+            scan["error"] = "header too short"
+            return scan
+        if header[:7] != ULOG_MAGIC:
+            scan["error"] = "not a ULog file"
+            return scan
+
+        offset = 16  # file offset of data[0]
+        rest = b""
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break  # anything left is a truncated last message
+            # a message cut at the end of the previous chunk continues here
+            data = rest + chunk
+            end = len(data)
+            pos = 0
+            in_chunk = {}  # msg_id -> position of its last data message in this chunk
+            while pos + 3 <= end:
+                size, msg_type = _message_header.unpack_from(data, pos)
+                if msg_type not in MESSAGE_TYPES:
+                    scan["corrupt_offset"] = offset + pos
+                    break
+                payload = pos + 3
+                if payload + size > end:
+                    break  # continued in the next chunk
+                if msg_type == 68:  # 'D'
+                    msg_id = _msg_id.unpack_from(data, payload)[0]
+                    if msg_id in counts:
+                        counts[msg_id] += 1
+                    else:
+                        counts[msg_id] = 1
+                        if formats.get(subscriptions.get(msg_id)) and size >= 10:
+                            first[msg_id] = _timestamp.unpack_from(data, payload + 2)[0]
+                    in_chunk[msg_id] = payload
+                elif msg_type == 65:  # 'A'
+                    multi_id = data[payload]
+                    msg_id = _msg_id.unpack_from(data, payload + 1)[0]
+                    if multi_id == 0:
+                        subscriptions[msg_id] = data[payload + 3:payload + size].decode(errors="replace")
+                elif msg_type == 70:  # 'F'
+                    name, _, fields = data[payload:payload + size].decode(errors="replace").partition(":")
+                    formats[name] = fields.startswith("uint64_t timestamp;")
+                pos = payload + size
+
+            for msg_id, payload in in_chunk.items():
+                if msg_id in first:
+                    last[msg_id] = _timestamp.unpack_from(data, payload + 2)[0]
+            if scan["corrupt_offset"] is not None:
+                break
+            rest = data[pos:]
+            offset += pos
+            if is_usable is not None:
+                summarize()
+                if is_usable(scan):
+                    scan["complete"] = False
+                    return scan
+    summarize()
+    return scan
+
+
+def triage_log(scan: dict, topics: dict = None, min_duration: float = 0.0,
+               require_topics: List[str] = ()) -> Tuple[str, str] | None:
+    # (status, reason) when the log can not give a usable flight, None otherwise.
+    # Conservative by design: anything accepted here may still be skipped by
+    # the full conversion, but nothing rejected here would have been converted
+    if scan["error"]:
+        return "error", f"Ulog file couldn't be read: {scan['error']}"
+    if scan["corrupt_offset"] is not None:
+        return None  # the counts stop at the corruption, the parser may recover the rest
+    missing = [topic for topic in require_topics if not scan["topics"].get(topic)]
+    if missing:
+        return "skipped", f"missing required topics {', '.join(missing)}"
+    names = list(topics) if topics is not None else list(scan["topics"])
+    if max((scan["topics"].get(name, 0) for name in names), default=0) < MIN_MESSAGES:
+        return "skipped", "mission mode too short"
+    if scan["duration_s"] < min_duration:
+        return "skipped", f"flight too short ({scan['duration_s']:.1f}s)"
+    return None
+
+
+def triage_ulog(path: str, topics: dict = None, min_duration: float = 0.0,
+                require_topics: List[str] = ()) -> Tuple[dict, Tuple[str, str] | None]:
+    # Scan a log only as far as needed and return the scan with its verdict
+    def is_usable(scan):
+        return triage_log(scan, topics, min_duration, require_topics) is None
+    scan = scan_ulog(path, is_usable)
+    return scan, triage_log(scan, topics, min_duration, require_topics)
+
+
+def load_triage_report(output_dir: str) -> dict:
+    path = os.path.join(output_dir, TRIAGE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_triage_report(output_dir: str, report: dict) -> None:
+    with atomic_output(os.path.join(output_dir, TRIAGE_FILE)) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
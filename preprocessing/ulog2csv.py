@@ -4,9 +4,25 @@ import os
 import numpy as np
 import pandas as pd
 from pyulog import ULog
-from pyulog.px4 import PX4ULog
-from typing import TypedDict, List
+from typing import TypedDict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import argparse
+import importlib.util
+import json
+from flight_io import (FLIGHT_FORMATS, align_native_flight, flight_key, read_metadata, write_flight, write_flight_index,
+                       write_native_flight)
+from pyramid import remove_pyramid, write_pyramid
+from manifest import (conversion_settings, is_up_to_date, load_manifest, load_manifest_entry, output_checksums,
+                      save_manifest, save_manifest_entry, source_signature)
+from leases import DEFAULT_TTL, LEASE_DIR, Lease
+from profiling import StageProfiler, print_profile_summary
+from resampling import centroid_index, resample_typed, resampled_dtype
+from triage import load_triage_report, save_triage_report, triage_ulog
+from sources import is_source_file, list_sources, open_source, source_name, source_stem
+from segments import SEGMENT_CRITERIA, find_segments, segment_topics, slice_columns
+from derived import DERIVED_VERSION, EULER_FIELDS, add_euler_angles, derive_columns
+from flight_store import (STORE_DIR, build_schema_registry, column_schema, save_schema_registry,
+                          write_store_partition)
 
 
 class MissionData(TypedDict):
@@ -21,6 +37,8 @@ def get_all_topics(ulog) -> dict:
     for dataset_name in ulog.data_list:
         # Get all field names except 'timestamp' which we handle separately
         fields = [field.field_name for field in dataset_name.field_data if field.field_name != 'timestamp']
+        # roll/pitch/yaw added by add_roll_pitch_yaw() are not in field_data
+        fields += [field for field in EULER_FIELDS.get(dataset_name.name, []) if field in dataset_name.data]
         params[dataset_name.name] = fields
     return params
 
@@ -226,10 +244,25 @@ def get_custom_topics() -> dict:
     }
 
 
-def extract_topics(ulog) -> List[MissionData] | str:
-    # Get all topics and their attributes
-    params = get_all_topics(ulog)
-    #params = get_custom_topics()
+def load_topic_selection(selection) -> dict:
+    # "custom" selects get_custom_topics(), anything else is a json file mapping
+    # topic names to field lists, an empty list keeps all fields of the topic
+    if selection == "custom":
+        return get_custom_topics()
+    with open(selection, "r") as f:
+        topics = json.load(f)
+    if not isinstance(topics, dict) or not all(isinstance(fields, list) for fields in topics.values()):
+        raise ValueError(f"{selection} must map topic names to lists of field names")
+    return topics
+
+
+def extract_topics(ulog, params: dict = None) -> List[MissionData] | str:
+    # Get all topics and their attributes unless a selection is given
+    all_topics = get_all_topics(ulog)
+    if params is None:
+        params = all_topics
+    else:
+        params = {dataset: attrs or all_topics.get(dataset, []) for dataset, attrs in params.items()}
     # create each column for the given attributes in params
     cols = []
     for dataset, attrs in params.items():
@@ -256,116 +289,449 @@ def extract_topics(ulog) -> List[MissionData] | str:
 
     return cols
 
-def subsample(col1, col2):
-    # Linear interpolation between points
-    col1["values"] = np.interp(col2["timestamp"], col1["timestamp"], col1["values"])
-    col1["timestamp"] = col2["timestamp"]
+def timeline_index(cols: List[MissionData], topics: dict = None) -> int:
+    # Index of the column whose timestamps become the timeline, the one closest
+    # to the median length among the logged fields. The Euler angles that
+    # get_all_topics() adds are left out, so storing them keeps the timeline
+    logged = [i for i, col in enumerate(cols)
+              if topics is not None or col["attr"] not in EULER_FIELDS.get(col["dataset"], [])]
+    return logged[centroid_index([cols[i] for i in logged])]
 
 
-def upsample(col1, col2):
-    # Linear interpolation to upsample
-    col2["values"] = np.interp(col1["timestamp"], col2["timestamp"], col2["values"])
-    col2["timestamp"] = col1["timestamp"]
+def synchronize_timeseries(cols: List[MissionData], reference_index, float32: bool = False) -> np.ndarray:
+    # Interpolate every column onto the timestamps of the column at reference_index.
+    # Fields of a topic share their timestamps, so interpolation indices and weights
+    # are computed once per topic. Integer and boolean fields keep their type and
+    # float fields become float64, or float32 if float32 is set and the source
+    # precision allows it. Returns the reference timeline as int64 microseconds
+    timeline = np.asarray(cols[reference_index]["timestamp"]).astype(np.int64)
+    for col, values in zip(cols, resample_typed(cols, timeline, float32)):
+        col["values"] = values
+        col["timestamp"] = timeline
+    return timeline
 
 
-def synchronize_timeseries(cols: List[MissionData], reference_index) -> None:
-    # down sample or upsample according to the size of given topic index as aligning_index
+def topic_spans(cols: List[MissionData]) -> dict:
+    # First and last native timestamp of every topic. Resampling holds the
+    # first/last value of a topic beyond them, readers clip its data to this span
+    spans = {}
     for col in cols:
-        if len(col["timestamp"]) > len(cols[reference_index]["timestamp"]):
-            subsample(col, cols[reference_index])
-        else:
-            upsample(cols[reference_index], col)
-
-
-def cols_to_df(cols: List[MissionData]) -> pd.DataFrame:
-    return pd.DataFrame(
-        np.vstack([cols[0]["timestamp"]] + [col["values"] for col in cols]).T,
-        columns=["timestamp"] + [f'{col["dataset"]}.{col["attr"]}' for col in cols],
-    )
-
-parser = argparse.ArgumentParser(description='Convert ULog files to CSV format')
-parser.add_argument('--skip-processed', action='store_true', 
-                   help='Skip files that have already been processed')
-args = parser.parse_args()
-skip_processed = args.skip_processed
-
-# change to current file's dir
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
-
-cwd = os.path.dirname(os.path.abspath(__file__))
-ulg_dir = os.path.join(cwd, "../data/ulg_files")
-output_csv_dir = os.path.join(cwd, "../data/csv_files")
-
-# make sure output csv dir exist
-if not os.path.isdir(output_csv_dir):
-    os.makedirs(output_csv_dir)
-
-ulg_paths = []
-for root, subfolders, files in os.walk(ulg_dir):
-    # Get relative path from ulg_dir to current folder
-    rel_path = os.path.relpath(root, ulg_dir)
-    
-    # Only create output directory if there are .ulg files
-    has_ulg_files = any(file.endswith('.ulg') for file in files)
-    if has_ulg_files:
-        output_path = os.path.join(output_csv_dir, rel_path)
-        if not os.path.isdir(output_path):
-            os.makedirs(output_path)
-            print("New directory:", output_path)
-
-    for i, file in enumerate(files):
-        if not file.endswith('.ulg'):
-            continue
-        ulog_path = os.path.join(root, file)
-        
-        # Create csv path maintaining the same folder structure
-        rel_csv_path = os.path.join(rel_path, os.path.basename(ulog_path)[:-4] + ".csv")
-        csv_loc = os.path.join(output_csv_dir, rel_csv_path)
-
-        # do not process files that have already been processed if --skip-processed is set
-        if skip_processed:
-            if os.path.exists(csv_loc):
-                print(f"{i+1} | File {csv_loc} already processed, skipping...")
+        timestamp = col["timestamp"]
+        if col["dataset"] not in spans and len(timestamp):
+            spans[col["dataset"]] = [int(timestamp[0]), int(timestamp[-1])]
+    return spans
+
+
+def cols_to_df(cols: List[MissionData], timeline: np.ndarray = None) -> pd.DataFrame:
+    if timeline is None:
+        timeline = np.asarray(cols[0]["timestamp"]).astype(np.int64, copy=False)
+    # assembled column by column, so every column keeps its dtype and no copy is made
+    data = {"timestamp": timeline}
+    data.update((f'{col["dataset"]}.{col["attr"]}', col["values"]) for col in cols)
+    return pd.DataFrame(data, copy=False)
+
+
+# Sources skipped by find_ulog_files() because another one has the same output
+_reported_collisions = set()
+
+
+def find_ulog_files(ulg_dir, output_csv_dir, extension=".csv") -> List[Tuple[str, str]]:
+    # Collect (ulog_path, output_loc) pairs, mirroring the folder hierarchy of ulg_dir.
+    # Compressed logs and the logs inside archives are included, archive members
+    # are written below a folder named after the archive. Sources that map to the
+    # same output, e.g. a.ulg and a.ulg.gz, are converted once, from the first one
+    tasks = []
+    outputs = {}
+    for root, subfolders, files in os.walk(ulg_dir):
+        subfolders.sort()
+        # Get relative path from ulg_dir to current folder
+        rel_path = os.path.relpath(root, ulg_dir)
+
+        # Only create output directory if there are .ulg files
+        has_ulg_files = any(is_source_file(file) for file in files)
+        if has_ulg_files:
+            output_path = os.path.join(output_csv_dir, rel_path)
+            if not os.path.isdir(output_path):
+                os.makedirs(output_path)
+                print("New directory:", output_path)
+
+        for file in sorted(files):
+            if not is_source_file(file):
                 continue
+            for ulog_path in list_sources(os.path.join(root, file)):
+                # Create output path maintaining the same folder structure
+                rel_output_path = os.path.join(rel_path, source_stem(ulog_path) + extension)
+                output_loc = os.path.join(output_csv_dir, rel_output_path)
+                if output_loc in outputs:
+                    # the ingestion daemon lists the sources again and again, warn once
+                    if ulog_path not in _reported_collisions:
+                        _reported_collisions.add(ulog_path)
+                        print(f"Skipping {ulog_path}: {outputs[output_loc]} is converted to the same "
+                              f"{os.path.normpath(rel_output_path)}")
+                    continue
+                outputs[output_loc] = ulog_path
+                os.makedirs(os.path.dirname(output_loc), exist_ok=True)
+                tasks.append((ulog_path, output_loc))
+    return tasks
+
+
+def convert_file(ulog_path, output_loc, topics=None, pyramid=False, float32=False, segments=None, store=None,
+                 profiler=None, is_claimed=None) -> Tuple[str, str]:
+    # Convert a single ulog file, returns (status, message) where status is
+    # one of "converted", "skipped" or "error". With segments only the armed,
+    # airborne or nav_state windows of the flight are kept. With a store
+    # ({"dir", "key"}) the flight is also written to the consolidated store.
+    # is_claimed() is checked before writing, a sharded worker that lost the
+    # lease of the log leaves the outputs to the worker that took it over
+    profiler = profiler or StageProfiler()
+    # a pyramid left from a previous conversion would be served for the new flight
+    remove_pyramid(output_loc)
+
+    # only the selected topics are decoded by the parser, the rest is skipped
+    message_filter = list(topics) if topics is not None else None
+    if message_filter is not None and segments is not None:
+        message_filter = list(dict.fromkeys(message_filter + segment_topics(segments)))
+    try:
+        with profiler.stage("parse"):
+            # compressed logs and archive members are parsed as streams
+            with open_source(ulog_path) as stream:
+                ulog = ULog(stream, message_filter)
+    except Exception as error:
+        return "error", f"Ulog file couldn't be read: {error}"
+    with profiler.stage("roll_pitch_yaw"):
+        add_euler_angles(ulog)
+
+    with profiler.stage("extract_topics"):
+        cols = extract_topics(ulog, topics)
+    if isinstance(cols, str):
+        return "skipped", f"missing dataset {cols}"
+    if not cols:
+        return "skipped", "no topics found"
+
+    intervals = None
+    if segments is not None:
+        with profiler.stage("segments"):
+            intervals = find_segments(ulog, segments)
+            if isinstance(intervals, str):
+                return "skipped", f"missing segment topic {intervals}"
+            if len(intervals) == 0:
+                return "skipped", "no matching segment"
+            cols = slice_columns(cols, intervals)
+        if not cols:
+            return "skipped", "no data in segments"
+
+    # Find the column closest to the median length, before derived columns are added
+    centroid_idx = timeline_index(cols, topics)
+
+    # computed once here instead of every time the server opens the flight
+    with profiler.stage("derived"):
+        derived = derive_columns(cols)
+
+    if len(cols[centroid_idx]["timestamp"]) < 100:
+        return "skipped", "mission mode too short"
+    metadata = {
+        "source": source_name(ulog_path),
+        "topic_selection": topics,
+        "derived": {"version": DERIVED_VERSION, "columns": derived},
+        # readers of the native layout align it on the timeline of this topic
+        "timeline": cols[centroid_idx]["dataset"],
+        "topic_spans": topic_spans(cols),
+    }
+    if intervals is not None:
+        metadata["segments"] = {**segments, "intervals": intervals.tolist()}
+
+    if is_claimed is not None and not is_claimed():
+        return "skipped", "lease was taken over"
+
+    # native layout keeps every topic at its own rate, aligned when loaded
+    if output_loc.endswith(FLIGHT_FORMATS["native"]):
+        # columns and types of the flight once it is aligned by a reader
+        metadata["schema"] = {"timestamp": "int64",
+                              **{f"{col['dataset']}.{col['attr']}": str(resampled_dtype(col["values"]))
+                                 for col in cols}}
+        with profiler.stage("write"):
+            write_native_flight(cols, output_loc, metadata)
+        aligned = align_native_flight(cols, cols[centroid_idx]["timestamp"]) if pyramid or store else None
+        if pyramid:
+            with profiler.stage("pyramid"):
+                write_pyramid(aligned, output_loc)
+        if store:
+            with profiler.stage("store"):
+                write_store_partition(store["dir"], store["key"], aligned)
+        profiler.count(rows=len(cols[centroid_idx]["timestamp"]), columns=len(cols) + 1)
+        return "converted", f"{len(set(col['dataset'] for col in cols))} topics, {len(cols)} columns"
+
+    # down or upsample data with the size of alignment column and
+    # change timestamps with the timestamp of the alignment column
+    with profiler.stage("synchronize_timeseries"):
+        timeline = synchronize_timeseries(cols, centroid_idx, float32)
+    with profiler.stage("cols_to_df"):
+        df = cols_to_df(cols, timeline)
+
+    # save in the format given by the output extension
+    metadata["schema"] = column_schema(df)
+    if is_claimed is not None and not is_claimed():
+        return "skipped", "lease was taken over"
+    with profiler.stage("write"):
+        write_flight(df, output_loc, metadata)
+    if pyramid:
+        with profiler.stage("pyramid"):
+            write_pyramid(df, output_loc)
+    if store:
+        with profiler.stage("store"):
+            write_store_partition(store["dir"], store["key"], df)
+    profiler.count(rows=df.shape[0], columns=df.shape[1])
+    return "converted", f"{df.shape[0]} rows, {df.shape[1]} columns"
+
+
+def _convert_task(index, ulog_path, output_loc, options, skip_processed=False, previous=None, profile=False,
+                  triage=None, shard=None, store=None):
+    # Worker entry point, one bad log must not kill the whole run. Returns the
+    # manifest entry of the file next to its status, None for failed files.
+    # With triage criteria the log is scanned first and rejected without decoding.
+    # In a sharded run ({"key", "output_dir", "ttl"}) the log is first claimed
+    # with a lease, so workers on other hosts sharing the volume leave it alone,
+    # and the result is dropped when the lease was taken over in the meantime.
+    # store ({"dir", "key"}) is passed on to convert_file() with options["store"]
+    result = {"index": index, "ulog_path": ulog_path, "output_loc": output_loc, "entry": None, "profile": None,
+              "triage": None}
+    profiler = StageProfiler()
+    lease = None
+    try:
+        if shard is not None:
+            lease = Lease(os.path.join(shard["output_dir"], LEASE_DIR), shard["key"], shard["ttl"])
+            if not lease.acquire():
+                holder, lease = lease.holder, None
+                return {**result, "status": "skipped", "message": f"claimed by {holder}"}
+            # another host may have converted it since this run started
+            previous = load_manifest_entry(shard["output_dir"], shard["key"])
+            skip_processed = True
+        source = source_signature(ulog_path, previous and previous["source"])
+        settings = conversion_settings(output_loc, {**options, "triage": triage})
+        # do not process files whose source and settings did not change if --skip-processed is set
+        if skip_processed and is_up_to_date(previous, source, settings, output_loc):
+            message = previous.get("message", "already processed") if previous["status"] == "skipped" \
+                else "already processed"
+            return {**result, "status": "skipped", "message": message, "entry": {**previous, "source": source}}
+
+        status = None
+        if triage is not None:
+            with profiler.stage("triage"):
+                scan, verdict = triage_ulog(ulog_path, options["topics"], **triage)
+            if verdict is not None:
+                status, message = verdict
+                result["triage"] = {"status": status, "reason": message, "scan": scan}
+        if status is None:
+            status, message = convert_file(ulog_path, output_loc, profiler=profiler,
+                                           is_claimed=lease.is_held if lease is not None else None,
+                                           **{**options, "store": store if options.get("store") else None})
+        if lease is not None and not lease.is_held():
+            # the outputs and manifest entry belong to the worker holding the lease now
+            return {**result, "status": "skipped", "message": "lease was taken over"}
+        if status != "error":
+            outputs = output_checksums(output_loc) if status == "converted" else {}
+            result["entry"] = {"source": source, "settings": settings, "status": status, "message": message,
+                               "outputs": outputs}
+            if status == "converted":
+                result["entry"]["schema"] = read_metadata(output_loc).get("schema")
+            profiler.count(bytes_written=sum(output["size"] for output in outputs.values()))
+            if shard is not None:
+                save_manifest_entry(shard["output_dir"], shard["key"], result["entry"])
+    except Exception as error:
+        status, message = "error", f"{type(error).__name__}: {error}"
+    finally:
+        if lease is not None:
+            lease.release()
+    if profile:
+        result["profile"] = profiler.to_record(ulog_path, status)
+    return {**result, "status": status, "message": message}
 
+
+def print_summary(results) -> None:
+    results = sorted(results, key=lambda result: result["index"])
+    counts = {"converted": 0, "skipped": 0, "error": 0}
+    for result in results:
+        counts[result["status"]] += 1
+
+    print("\nSummary:")
+    print(f"Converted: {counts['converted']}, Skipped: {counts['skipped']}, Errors: {counts['error']}")
+    for result in results:
+        if result["status"] != "converted":
+            print(f"{result['index']+1} | {result['status'].upper()} {result['ulog_path']}: {result['message']}")
+
+
+def add_conversion_arguments(parser: argparse.ArgumentParser) -> None:
+    # Options that change the produced files, shared with the ingestion daemon
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of worker processes, 0 uses all cores (default: 1)')
+    parser.add_argument('--format', choices=list(FLIGHT_FORMATS), default='csv',
+                        help='Output file format, feather and parquet need pyarrow, native stores '
+                             'every topic at its own rate (default: csv)')
+    parser.add_argument('--topics', default=None,
+                        help="Topic/field selection json file, or 'custom' for get_custom_topics(); "
+                             "only these topics are decoded (default: all topics)")
+    parser.add_argument('--pyramid', action='store_true',
+                        help='Also write a min/max level-of-detail pyramid used by the server for long flights')
+    parser.add_argument('--float32', action='store_true',
+                        help='Keep float32 sensor fields as float32 instead of widening them to float64')
+    parser.add_argument('--min-duration', type=float, default=0.0,
+                        help='Reject logs shorter than this many seconds before decoding them (default: 0)')
+    parser.add_argument('--require-topics', default='',
+                        help='Comma separated topics a log must contain to be converted')
+    parser.add_argument('--no-triage', action='store_true',
+                        help='Decode every log instead of rejecting unusable logs from a header scan first')
+    parser.add_argument('--segments', nargs='+', choices=list(SEGMENT_CRITERIA), default=[],
+                        help='Only keep the samples where all of these hold: armed (vehicle_status.arming_state) '
+                             'and/or airborne (vehicle_land_detected.landed is false)')
+    parser.add_argument('--nav-states', default='',
+                        help='Comma separated vehicle_status.nav_state values to keep, combined with --segments')
+    parser.add_argument('--segment-padding', type=float, default=2.0,
+                        help='Seconds kept before and after every segment (default: 2)')
+    parser.add_argument('--store', action='store_true',
+                        help=f'Also write every converted flight to the consolidated parquet store '
+                             f'data/{STORE_DIR}, partitioned by flight (needs pyarrow)')
+
+
+def conversion_options(parser: argparse.ArgumentParser, args) -> Tuple[dict, dict | None]:
+    # convert_file() options and triage criteria from the parsed arguments
+    options = {
+        "topics": load_topic_selection(args.topics) if args.topics else None,
+        "pyramid": args.pyramid,
+        "float32": args.float32,
+    }
+    if args.segments or args.nav_states:
         try:
-            ulog = ULog(ulog_path)
-        except:
-            print("Ulog file couldn't be read:", ulog_path)
-        px4ulog = PX4ULog(ulog)
-        px4ulog.add_roll_pitch_yaw()
-
-        cols = extract_topics(ulog)
-        if isinstance(cols, str):
-            print(f"{i+1} | Skipping {ulog_path}, missing dataset {cols}")
-            continue
+            nav_states = sorted(int(state) for state in args.nav_states.split(",") if state)
+        except ValueError:
+            parser.error(f"--nav-states expects comma separated integers, got {args.nav_states!r}")
+        # only set when used, so the settings of earlier conversions still match
+        options["segments"] = {"criteria": args.segments, "nav_states": nav_states,
+                               "padding_s": args.segment_padding}
+    if args.format in ('feather', 'parquet') and importlib.util.find_spec('pyarrow') is None:
+        parser.error(f"--format {args.format} requires pyarrow, install it with 'pip3 install pyarrow'")
+    if args.store and importlib.util.find_spec('pyarrow') is None:
+        parser.error("--store requires pyarrow, install it with 'pip3 install pyarrow'")
+    triage = None if args.no_triage else {
+        "min_duration": args.min_duration,
+        "require_topics": [topic for topic in args.require_topics.split(",") if topic],
+    }
+    if args.store:
+        options["store"] = True
+    return options, triage
 
-        # Convert lengths of time to numpy array
-        timestamps_len = np.array([len(col["timestamp"]) for col in cols])
-        
-        # Find longest (highest frequency) series
-        longest_idx = np.argmax(timestamps_len)
-        longest_len = timestamps_len[longest_idx]
-        
-        # Find shortest (lowest frequency) series
-        shortest_idx = np.argmin(timestamps_len)
-        shortest_len = timestamps_len[shortest_idx]
-        
-        # Statistical measures
-        mean_len = np.mean(timestamps_len)
-        median_len = np.median(timestamps_len)
-        
-        # Find the column closest to the median
-        centroid_idx = np.argmin(np.abs(timestamps_len - median_len))
-
-        # down or upsample data with the size of alignment column and 
-        # change timestamps with the timestamp of the alignment column
-        synchronize_timeseries(cols, centroid_idx)
-        df = cols_to_df(cols)
-
-        # save to csv
-        if df.shape[0] < 100:
-            print(f"{i+1} | Mission mode in file {csv_loc} too short, skipping...")
-            continue
-        print(f"{i+1} | Converting {ulog_path} to {csv_loc}")
-        df.to_csv(csv_loc, index=False)
+
+def store_tasks(tasks, output_dir: str, enabled: bool) -> list:
+    # {"dir", "key"} of every task for the consolidated store, keyed like mapping.json
+    store_dir = os.path.join(os.path.dirname(output_dir), STORE_DIR)
+    return [{"dir": store_dir, "key": flight_key(os.path.relpath(output_loc, output_dir))} if enabled else None
+            for _, output_loc in tasks]
+
+
+def update_schema_registry(output_dir: str, manifest: dict, tasks, keys) -> None:
+    # Rebuild the schema registry from the manifest entries of the current sources
+    schemas = {}
+    for (_, output_loc), key in zip(tasks, keys):
+        entry = manifest.get(key)
+        if entry and entry["status"] == "converted" and entry.get("schema"):
+            schemas[flight_key(os.path.relpath(output_loc, output_dir))] = entry["schema"]
+    save_schema_registry(output_dir, build_schema_registry(schemas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert ULog files to CSV or columnar formats')
+    parser.add_argument('--skip-processed', action='store_true',
+                        help='Skip files whose source log and conversion settings did not change since '
+                             'they were last processed')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='Write per-stage timing and memory of every file to FILE as json lines '
+                             'and print a summary at the end')
+    parser.add_argument('--shard', action='store_true',
+                        help='Claim every log with a lease file first, so several hosts sharing the data '
+                             'directory can convert it together (implies --skip-processed)')
+    parser.add_argument('--lease-ttl', type=float, default=DEFAULT_TTL,
+                        help=f'Seconds after which the lease of a crashed worker is taken over (default: {DEFAULT_TTL})')
+    parser.add_argument('--data-dir', default=None,
+                        help='Directory holding ulg_files and csv_files (default: ../data next to this script)')
+    add_conversion_arguments(parser)
+    args = parser.parse_args()
+    options, triage = conversion_options(parser, args)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.abspath(args.data_dir) if args.data_dir else os.path.join(cwd, "../data")
+
+    # change to current file's dir
+    os.chdir(cwd)
+
+    ulg_dir = os.path.join(data_dir, "ulg_files")
+    output_csv_dir = os.path.join(data_dir, "csv_files")
+
+    # make sure output csv dir exist
+    if not os.path.isdir(output_csv_dir):
+        os.makedirs(output_csv_dir)
+
+    tasks = find_ulog_files(ulg_dir, output_csv_dir, FLIGHT_FORMATS[args.format])
+    # manifest entries are keyed by the source path relative to ulg_dir
+    manifest = load_manifest(output_csv_dir)
+    keys = [os.path.relpath(ulog_path, ulg_dir) for ulog_path, _ in tasks]
+    # rejected logs with the reason and what the header scan found
+    triage_report = {key: entry for key, entry in load_triage_report(output_csv_dir).items() if key in keys}
+
+    profile_file = open(args.profile, "w") if args.profile else None
+    # sharded workers store their manifest entries themselves, the shared
+    # manifest and triage report are only rewritten by unsharded runs
+    shards = [{"key": key, "output_dir": output_csv_dir, "ttl": args.lease_ttl} if args.shard else None
+              for key in keys]
+    stores = store_tasks(tasks, output_csv_dir, args.store)
+
+    def report(result):
+        index = result["index"]
+        if result["status"] == "converted":
+            print(f"{index+1} | Converted {result['ulog_path']} to {result['output_loc']} ({result['message']})")
+        else:
+            print(f"{index+1} | {result['status'].capitalize()} {result['ulog_path']}: {result['message']}")
+
+        if result["entry"] is not None:
+            manifest[keys[index]] = result["entry"]
+        if result["triage"] is not None:
+            triage_report[keys[index]] = result["triage"]
+        elif result["status"] == "converted":
+            triage_report.pop(keys[index], None)
+        if profile_file and result["profile"]:
+            profile_file.write(json.dumps(result["profile"]) + "\n")
+        # save regularly so an interrupted run keeps its progress
+        if len(results) % 50 == 0 and not args.shard:
+            save_manifest(output_csv_dir, manifest)
+
+    results = []
+    if jobs == 1:
+        for i, (ulog_path, output_loc) in enumerate(tasks):
+            results.append(_convert_task(i, ulog_path, output_loc, options, args.skip_processed,
+                                         manifest.get(keys[i]), profile_file is not None, triage, shards[i],
+                                         stores[i]))
+            report(results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(_convert_task, i, ulog_path, output_loc, options, args.skip_processed,
+                                manifest.get(keys[i]), profile_file is not None, triage, shards[i], stores[i])
+                for i, (ulog_path, output_loc) in enumerate(tasks)
+            ]
+            for future in as_completed(futures):
+                results.append(future.result())
+                report(results[-1])
+
+    if not args.shard:
+        save_manifest(output_csv_dir, manifest)
+        save_triage_report(output_csv_dir, triage_report)
+    # a sharded worker only knows its own conversions, the others are in the entry files
+    update_schema_registry(output_csv_dir, load_manifest(output_csv_dir) if args.shard else manifest, tasks, keys)
+    write_flight_index(output_csv_dir)
+    print_summary(results)
+    if profile_file:
+        profile_file.close()
+        print_profile_summary([result["profile"] for result in results if result["profile"]])
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 from bokeh.layouts import row, column
 from bokeh.plotting import Document
 from bokeh.server.server import Server
-from plotting import plot_df
+from plotting import create_plots, update_plots
 from bokeh.models import (
     CustomJS,
     ColumnDataSource,
@@ -14,13 +14,28 @@ from bokeh.models import (
 )
 from css import LAYOUT_SETTINGS
 
+from loading import load_flight
+from flight_cache import FlightCache
+from flight_io import flight_index_version, flight_key, read_flight_index
+
 import os
 import json
 import pandas as pd
-import numpy as np
 cwd = os.path.dirname(os.path.abspath(__file__))
 csv_dir = os.path.join(cwd, "../data/csv_files")
 mapping_file = os.path.join(cwd, "../data/mapping.json")
+# Approximate plot width in pixels, long flights with a level-of-detail pyramid
+# are loaded with about one bucket per pixel instead of at full resolution
+plot_width_px = 1600
+# How often a session checks the flight index published by the converters
+index_poll_ms = 5000
+# Memory for loaded flights shared by all sessions, the neighbours of the shown
+# flight are loaded in the background so that Next/Previous do not wait
+flight_cache_bytes = 1 << 30
+# Send plotted values to the browser as float32, which halves the payload of a
+# flight. Values keep about 7 significant digits, large values such as raw
+# lat/lon or timestamps lose precision, the time axis always stays exact
+plot_float32 = False
 
 # make sure files and dirs exist
 if not os.path.isdir(csv_dir):
@@ -31,30 +46,33 @@ if os.path.exists(mapping_file):
     with open(mapping_file, "r") as f:
         mapping = json.load(f)
 
-all_files = []
-for root, _, files in os.walk(csv_dir):
-    for file in files:
-        if file.endswith('.csv'):
-            # Get path relative to csv_dir
-            rel_path = os.path.relpath(root, csv_dir)
-            if rel_path == '.':
-                rel_file = file
-            else:
-                rel_file = os.path.join(rel_path, file)
-            all_files.append(rel_file)
-
-labeled_files = [f"{key}.csv" for key in mapping.keys()]
+# Flight files (csv, feather or parquet) relative to csv_dir, sorted for a consistent order
+all_files = read_flight_index(csv_dir)
 
-# Sort all_files to ensure consistent order
-all_files.sort()
+labeled_files = [f for f in all_files if flight_key(f) in mapping]
 
 # Find first unannotated file for initial load
 current_idx = 0
 for idx, file in enumerate(all_files):
-    if file[:-4] not in mapping:  # Remove .csv extension when checking mapping
+    if flight_key(file) not in mapping:  # Remove extension when checking mapping
         current_idx = idx
         break
 
+flight_cache = FlightCache(lambda path: load_flight(path, plot_width_px), flight_cache_bytes)
+
+
+def neighbour_files(idx: int) -> list:
+    # Flights an annotator opens next: the next and previous ones and the next unannotated one
+    if not all_files:
+        return []
+    neighbours = [all_files[(idx + 1) % len(all_files)], all_files[(idx - 1) % len(all_files)]]
+    for step in range(1, len(all_files)):
+        fname = all_files[(idx + step) % len(all_files)]
+        if flight_key(fname) not in mapping:
+            neighbours.append(fname)
+            break
+    return list(dict.fromkeys(neighbours))
+
 def main_app(doc: Document):  
     # Customize your classes  
     anomaly_classes = ['Uncategorized', 'Normal','Mechanical', 'Altitude', 'External Position', 
@@ -96,9 +114,10 @@ def main_app(doc: Document):
             "margin-bottom": "20px"
         }
     )
-        
-    bokeh_models = []  # Initialize empty list for models
-    
+
+    # Figures of this session, loading a flight only replaces their data
+    plots = create_plots()
+
     title = Div(
         text="Annotate anomalies in log file",
         visible=True,
@@ -212,7 +231,7 @@ def main_app(doc: Document):
     main_content = column(
         header,
         loader,
-        *bokeh_models,
+        *plots["models"],
         sizing_mode="stretch_width",
         styles={
             "align-items": "center", 
@@ -264,7 +283,7 @@ def main_app(doc: Document):
     def get_button_properties(fname):
         """Helper function to determine button type and label based on file annotations"""
         is_labeled = fname in labeled_files
-        file_info = mapping.get(fname[:-4], {"annotations": []})
+        file_info = mapping.get(flight_key(fname), {"annotations": []})
         annotations = file_info.get("annotations", [])
         display_name = os.path.basename(fname)
         
@@ -306,6 +325,7 @@ def main_app(doc: Document):
         btn.js_on_click(CustomJS(
             args=dict(fname=fname, source=source, loader=loader),
             code="""
+                loader.visible = true;
                 source.data = {
                     'data': ['load_file', fname]
                 };
@@ -315,50 +335,15 @@ def main_app(doc: Document):
         
         return btn
 
-    def convert_global_position(df):
-        # Calculate relative global positions
-        if 'vehicle_global_position.lat' in df.columns:
-            # Convert to degrees first
-            df['vehicle_global_position.lat'] = df['vehicle_global_position.lat']
-            df['vehicle_global_position.lon'] = df['vehicle_global_position.lon']
-            df['vehicle_global_position.alt'] = df['vehicle_global_position.alt']
-            # Convert lat/lon differences to approximate meters
-            # Using simple approximation: 1 degree = 111,111 meters at the equator
-            df['vehicle_global_position.x'] = (df['vehicle_global_position.lon'] - df['vehicle_global_position.lon'].iloc[0]) * 111111 * np.cos(np.radians(df['vehicle_global_position.lat'].iloc[0]))
-            df['vehicle_global_position.y'] = (df['vehicle_global_position.lat'] - df['vehicle_global_position.lat'].iloc[0]) * 111111
-            df['vehicle_global_position.z'] = df['vehicle_global_position.alt'] - df['vehicle_global_position.alt'].iloc[0]
-
-        if 'vehicle_gps_position.lat' in df.columns:
-            # Convert to degrees first
-            df['vehicle_gps_position.lat'] = df['vehicle_gps_position.lat'] * 1e-7
-            df['vehicle_gps_position.lon'] = df['vehicle_gps_position.lon'] * 1e-7
-            df['vehicle_gps_position.alt'] = df['vehicle_gps_position.alt'] * 1e-3
-
-            # Convert lat/lon differences to approximate meters
-            df['vehicle_gps_position.x'] = (df['vehicle_gps_position.lon'] - df['vehicle_gps_position.lon'].iloc[0]) * 111111 * np.cos(np.radians(df['vehicle_gps_position.lat'].iloc[0]))
-            df['vehicle_gps_position.y'] = (df['vehicle_gps_position.lat'] - df['vehicle_gps_position.lat'].iloc[0]) * 111111
-            df['vehicle_gps_position.z'] = df['vehicle_gps_position.alt'] - df['vehicle_gps_position.alt'].iloc[0]
-
-    def invert_z_position(df):
-        if 'vehicle_local_position.z' in df.columns:
-            df['vehicle_local_position.z'] = -df['vehicle_local_position.z']
-        if 'vehicle_local_position_setpoint.z' in df.columns:
-            df['vehicle_local_position_setpoint.z'] = -df['vehicle_local_position_setpoint.z']
-        if 'vehicle_visual_odometry.z' in df.columns:
-            df['vehicle_visual_odometry.z'] = -df['vehicle_visual_odometry.z']
-        if 'vehicle_vision_position.z' in df.columns:
-            df['vehicle_vision_position.z'] = -df['vehicle_vision_position.z']
-
     # Add new function to handle file navigation
     def load_file(relative_name):
         global csv_path, df, current_idx
-        nonlocal bokeh_models, main_content
         
         # Update current_idx to match the loaded file
         current_idx = all_files.index(relative_name)
         
         # Update anomaly classes display
-        file_base = relative_name[:-4]
+        file_base = flight_key(relative_name)
         if file_base in mapping:
             classes = set()
             for annotation in mapping[file_base]["annotations"]:
@@ -370,29 +355,23 @@ def main_app(doc: Document):
         
         csv_path = os.path.join(csv_dir, relative_name)
         if csv_path and os.path.exists(csv_path):
-            # Load the new file
-            df = pd.read_csv(csv_path)
-
-            convert_global_position(df)
-            invert_z_position(df)
+            # Load the new file, decimated to the screen width if a pyramid exists,
+            # usually it was already prefetched
+            df = flight_cache.get(csv_path)
             
             # Update filename display
             filename_display.text = f"Current file: {relative_name}"  # Show full relative path
             
-            # Create new bokeh models or update existing models with new data
-            bokeh_models = plot_df(df, mapping, relative_name)
-            
-            # Update main_content with models and hide loader
-            main_content.children = [header] + bokeh_models
-            
+            # Show the flight in the existing figures and hide loader
+            update_plots(plots, df, mapping, relative_name, float32=plot_float32)
+            loader.visible = False
+
+            flight_cache.prefetch([os.path.join(csv_dir, f) for f in neighbour_files(current_idx)])
             return True
         return False
 
     def on_next_click():
         global current_idx
-        # Show loader and remove plots while loading
-        main_content.children = [header] + [loader]
-        
         # Find next file, allowing both annotated and unannotated files
         next_idx = (current_idx + 1) % len(all_files)
         current_idx = next_idx
@@ -401,9 +380,6 @@ def main_app(doc: Document):
 
     def on_prev_click():
         global current_idx
-        # Show loader and remove plots while loading
-        main_content.children = [header] + [loader]
-
         # Find previous file, allowing both annotated and unannotated files
         prev_idx = (current_idx - 1) % len(all_files)
         current_idx = prev_idx
@@ -456,11 +432,7 @@ def main_app(doc: Document):
 
         action = new["data"][0]
 
-        # Show loader and remove plots while loading
-        main_content.children = [header] + [loader]
-        
         if action == "load_file":
-            main_content.children = [header] + [loader]
             filename = new["data"][1]
             current_idx = all_files.index(filename)
             new_path = os.path.join(csv_dir, filename)
@@ -478,7 +450,7 @@ def main_app(doc: Document):
             
             # Get the current file name from the actual loaded file path
             current_file = all_files[current_idx]
-            file_base = current_file[:-4]  # Remove .csv extension
+            file_base = flight_key(current_file)  # Remove file extension
             
             print(f"Saving annotation for file: {current_file}")  # Debug print
             
@@ -527,9 +499,9 @@ def main_app(doc: Document):
         relative_name = all_files[current_idx]
         
         # Remove from mapping
-        file_base = relative_name[:-4]  # Remove .csv extension
+        file_base = flight_key(relative_name)  # Remove file extension
         if file_base in mapping:
-            del mapping[relative_name[:-4]]
+            del mapping[file_base]
             
             # Save updated mapping
             with open(mapping_file, "w") as f:
@@ -569,10 +541,41 @@ def main_app(doc: Document):
         }
     )
 
+    # Pick up flights published by ingest.py or ulog2csv.py while the server runs
+    index_version = flight_index_version(csv_dir)
+
+    def refresh_file_list():
+        global current_idx
+        nonlocal index_version, file_items, buttons_by_file
+        version = flight_index_version(csv_dir)
+        if version == index_version:
+            return
+        index_version = version
+
+        # all_files is shared by the sessions, only the first one to notice adds the new flights
+        new_files = [f for f in read_flight_index(csv_dir) if f not in all_files]
+        if new_files:
+            current_file = all_files[current_idx] if all_files else None
+            all_files.extend(new_files)
+            all_files.sort()
+            labeled_files.extend(f for f in new_files if flight_key(f) in mapping)
+            if current_file is not None:
+                current_idx = all_files.index(current_file)
+        if set(buttons_by_file) == set(all_files):
+            return
+        print(f"Flight index updated, {len(all_files)} files")
+        file_items, buttons_by_file = create_file_list()
+        file_list.children = [file_list_title, stats_display, *file_items]
+        update_stats_display()
+
     # Initialize with first file
     load_file(all_files[current_idx])
 
     ##### PAGE LAYOUT #####
+    # Show the loader in the browser until the server has shown the next flight
+    show_loader = CustomJS(args=dict(loader=loader), code="loader.visible = true")
+    for button in (bclear, bnext, bprev):
+        button.js_on_click(show_loader)
     # Add click handler for clear button
     bclear.on_click(on_clear_click)
     # Add the button click handlers
@@ -600,6 +603,7 @@ def main_app(doc: Document):
                 data.push(name.value)  // Add note
                 data.push(true) // for saving
                 data.push(Math.random()) // ensuring on_change gets triggered
+                loader.visible = true
                 source.data = {
                     data
                 }
@@ -632,6 +636,7 @@ def main_app(doc: Document):
 
     # Update theme assignment
     doc.add_root(layout)
+    doc.add_periodic_callback(refresh_file_list, index_poll_ms)
 
 
 if __name__ == "__main__":
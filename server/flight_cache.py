@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List
+import pandas as pd
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    # Columns are numeric, the shallow size is the real size
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+
+class FlightCache:
+    """Loaded flights kept in least recently used order up to max_bytes, with background prefetch"""
+
+    def __init__(self, load: Callable[[str], pd.DataFrame], max_bytes: int, workers: int = 2):
+        self._load = load
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._frames = OrderedDict()  # key -> (df, size)
+        self._pending = {}  # key -> Future of a running load
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    @staticmethod
+    def _key(path: str) -> tuple:
+        # a reconverted flight has another size or mtime and is loaded again
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime_ns
+
+    def _store(self, key: tuple, df: pd.DataFrame) -> None:
+        size = frame_bytes(df)
+        with self._lock:
+            self._pending.pop(key, None)
+            if size > self.max_bytes or key in self._frames:
+                return
+            self._frames[key] = (df, size)
+            self.size_bytes += size
+            # evict the least recently used flights
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self.size_bytes -= evicted
+
+    def _load_and_store(self, key: tuple) -> pd.DataFrame:
+        try:
+            df = self._load(key[0])
+        except BaseException:
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+        self._store(key, df)
+        return df
+
+    def get(self, path: str) -> pd.DataFrame:
+        # The flight from the cache, from a running prefetch, or loaded now
+        key = self._key(path)
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key][0]
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+        try:
+            df = self._load_and_store(key)
+        except BaseException as error:
+            pending.set_exception(error)
+            raise
+        pending.set_result(df)
+        return df
+
+    def prefetch(self, paths: List[str]) -> None:
+        # Load flights in the background unless they are cached or being loaded
+        for path in paths:
+            try:
+                key = self._key(path)
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                if key in self._frames or key in self._pending:
+                    continue
+                pending = self._pending[key] = Future()
+            self._executor.submit(self._prefetch_one, key, pending)
+
+    def _prefetch_one(self, key: tuple, pending: Future) -> None:
+        try:
+            pending.set_result(self._load_and_store(key))
+        except Exception as error:
+            # the error is raised again when the flight is opened
+            pending.set_exception(error)
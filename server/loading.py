@@ -0,0 +1,23 @@
+import os
+import sys
+import pandas as pd
+
+# flight file readers are shared with the preprocessing scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../preprocessing"))
+from flight_io import read_flight, read_metadata
+from derived import derive_table
+from pyramid import load_pyramid_level
+
+
+def load_flight(path: str, max_buckets: int) -> pd.DataFrame:
+    # Load a flight file ready for plotting, decimated to about max_buckets
+    # buckets if a level-of-detail pyramid exists for a long flight
+    df = load_pyramid_level(path, max_buckets)
+    if df is None:
+        df = read_flight(path)
+
+    # flights converted before the derived columns were stored get them here
+    if "derived" not in read_metadata(path):
+        derive_table(df)
+    df['datetime'] = pd.to_datetime(df['timestamp'], unit='us')
+    return df
@@ -1,9 +1,10 @@
 from typing import Any
+import os
 import numpy as np
 import pandas as pd
 import itertools
 from bokeh.plotting import figure
-from bokeh.models import CustomJS, Model, BoxAnnotation, Label, CustomJSTickFormatter
+from bokeh.models import ColumnDataSource, CustomJS, Model, LabelSet, CustomJSTickFormatter
 from bokeh.palettes import Dark2_5 as palette
 from css import apply_plot_theme
 
@@ -50,13 +51,13 @@ figures = [
         "title": "Position Z",
         "unit": "m",
         "plots": [
-            {"col": "vehicle_local_position.z", "label": "Z"}, # invert the data
-            #{"col": "vehicle_local_position_setpoint.z", "label": "Z Setpoint"}, # invert the data
+            {"col": "vehicle_local_position.z_up", "label": "Z"},
+            #{"col": "vehicle_local_position_setpoint.z_up", "label": "Z Setpoint"},
             #{"col": "vehicle_air_data.baro_alt_meter", "label": "Altitude(m)"},
             {"col": "distance_sensor.current_distance", "label": "Distance Sensor"},
-            {"col": "vehicle_visual_odometry.z", "label": "External Position Z"},
-            {"col": "vehicle_vision_position.z", "label": "External Position Z"},
-            #{"col": "vehicle_gps_position.alt", "label": "GPS Alt"},
+            {"col": "vehicle_visual_odometry.z_up", "label": "External Position Z"},
+            {"col": "vehicle_vision_position.z_up", "label": "External Position Z"},
+            #{"col": "vehicle_gps_position.alt_m", "label": "GPS Alt"},
             #{"col": "sensor_combined.alt", "label": "Sensor Alt"},
             #{"col": "vehicle_global_position.alt", "label": "Global Position Alt"},
             {"col": "vehicle_gps_position.z", "label": "GPS Z"},
@@ -77,9 +78,9 @@ figures = [
             # {"col": "vehicle_global_position.lat", "label": "Latitude"},
             # {"col": "vehicle_global_position.lon", "label": "Longitude"},
             # {"col": "vehicle_global_position.alt", "label": "Altitude"},
-            # {"col": "vehicle_gps_position.lat", "label": "GPS Latitude"},
-            # {"col": "vehicle_gps_position.lon", "label": "GPS Longitude"},
-            # {"col": "vehicle_gps_position.alt", "label": "GPS Altitude"},
+            # {"col": "vehicle_gps_position.lat_deg", "label": "GPS Latitude"},
+            # {"col": "vehicle_gps_position.lon_deg", "label": "GPS Longitude"},
+            # {"col": "vehicle_gps_position.alt_m", "label": "GPS Altitude"},
             {"col": "vehicle_global_position.x", "label": "Global Position X"},
             {"col": "vehicle_global_position.y", "label": "Global Position Y"},
             {"col": "vehicle_global_position.z", "label": "Global Position Z"},
@@ -94,10 +95,10 @@ figures = [
         "plots": [
             {"col": "vehicle_vision_position.x", "label": "External Position X"},
             {"col": "vehicle_vision_position.y", "label": "External Position Y"},
-            {"col": "vehicle_vision_position.z", "label": "External Position Z"},
+            {"col": "vehicle_vision_position.z_up", "label": "External Position Z"},
             {"col": "vehicle_visual_odometry.x", "label": "External Position X"},
             {"col": "vehicle_visual_odometry.y", "label": "External Position Y"},
-            {"col": "vehicle_visual_odometry.z", "label": "External Position Z"},
+            {"col": "vehicle_visual_odometry.z_up", "label": "External Position Z"},
         ],
     },
     {
@@ -286,7 +287,11 @@ def quaternion_to_euler(q0, q1, q2, q3):
     
 
 def check_quaternion_plot(df, columns):
+    # roll/pitch/yaw are stored with the flight by the converter, older
+    # flights only have the quaternions
     if "vehicle_attitude.q[" in columns:
+        if "vehicle_attitude.roll" in df.columns:
+            return df["vehicle_attitude.roll"], df["vehicle_attitude.pitch"], df["vehicle_attitude.yaw"], ""
         q0 = df["vehicle_attitude.q[0]"]
         q1 = df["vehicle_attitude.q[1]"]
         q2 = df["vehicle_attitude.q[2]"]
@@ -294,63 +299,198 @@ def check_quaternion_plot(df, columns):
         label = ""
 
     elif "vehicle_attitude_setpoint.q_d[" in columns:
+        if "vehicle_attitude_setpoint.roll_d" in df.columns:
+            return (df["vehicle_attitude_setpoint.roll_d"], df["vehicle_attitude_setpoint.pitch_d"],
+                    df["vehicle_attitude_setpoint.yaw_d"], "Setpoint")
         q0 = df["vehicle_attitude_setpoint.q_d[0]"]
         q1 = df["vehicle_attitude_setpoint.q_d[1]"]
         q2 = df["vehicle_attitude_setpoint.q_d[2]"]
         q3 = df["vehicle_attitude_setpoint.q_d[3]"]
         label = "Setpoint"
 
+    else:
+        # e.g. the actuator controls listed in the attitude figures
+        raise ValueError(f"{columns} is not a quaternion column")
+
     roll, pitch, yaw = quaternion_to_euler(q0, q1, q2, q3)
     
     return roll, pitch, yaw, label
 
-# Plot the dataframe with the given models, highlight the anomalies and return the models
-def plot_df(df: pd.DataFrame, mapping: dict = None, file_name: str = None):
+# Define flight mode colors
+flight_mode_colors = {
+    0: "#ff3300",  # Manual
+    1: "#2d2d4d",  # Altitude
+    2: "#2d4d2d",  # Position
+    3: "#4d2d2d",  # Mission
+    4: "#4d4d2d",  # Loiter
+    5: "#2d4d4d",  # Return
+    7: "#3d2d4d",  # Auto RTL
+    12: "#4d3d2d",  # Descend
+    14: "#3d4d2d",  # Offboard
+    15: "#4d2d3d",  # Stabilized
+    17: "#3d2d2d",  # Auto Takeoff
+    18: "#2d2d3d",  # Auto Land
+}
+flight_mode_labels = {
+    0: "Manual",
+    1: "Altitude",
+    2: "Position",
+    3: "Mission",
+    4: "Loiter",
+    5: "Return",
+    7: "Auto RTL",
+    12: "Descend",
+    14: "Offboard",
+    15: "Stabilized",
+    17: "Auto Takeoff",
+    18: "Auto Land",
+}
+
+
+def line_label(f: dict, p: dict) -> str:
+    # Attitude figures show the roll/pitch of the quaternion in the column
+    if f["title"] == "Attitude Roll":
+        return "Roll " + ("Setpoint" if "vehicle_attitude_setpoint.q_d[" in p["col"] else "")
+    elif f["title"] == "Attitude Pitch":
+        return "Pitch " + ("Setpoint" if "vehicle_attitude_setpoint.q_d[" in p["col"] else "")
+    return p["label"]
+
+
+def line_column(f: dict, p: dict) -> str:
+    # Name of the line's column in the flight source, the attitude figures plot
+    # the roll/pitch of the quaternion in the column
+    if f["title"] == "Attitude Roll":
+        return p["col"] + ":roll"
+    elif f["title"] == "Attitude Pitch":
+        return p["col"] + ":pitch"
+    return p["col"]
+
+
+def line_values(df: pd.DataFrame, f: dict, p: dict):
+    # y values of a line, raises if the flight lacks its column
+    if f["title"] == "Attitude Roll":
+        return check_quaternion_plot(df, p["col"])[0]
+    elif f["title"] == "Attitude Pitch":
+        return check_quaternion_plot(df, p["col"])[1]
+    return df[p["col"]]
+
+
+# Create the figures of a session once, every loaded flight only replaces the
+# data of their sources so that a file switch sends arrays, not new models
+def create_plots() -> dict:
     alpha = 0.7
-    colors = itertools.cycle(palette)
+    # flight mode bands are the same in every figure and share one source
+    modes = ColumnDataSource(data=dict(x0=[], x1=[], center=[], text=[], color=[]))
+    # The time axis and every plotted column of a flight are sent once in a
+    # source shared by all lines. Lines of columns the flight lacks point to a
+    # source that stays empty, a line must not name a missing column
+    flight = ColumnDataSource(data=dict(datetime=[]))
+    empty = ColumnDataSource(data=dict(datetime=[], **{line_column(f, p): [] for f in figures for p in f["plots"]}))
+    # counts the loads, a new or reloaded flight drops the boxes drawn before
+    loads = ColumnDataSource(data=dict(count=[0]))
+    loads.js_on_change("data", CustomJS(code="""
+        if (!window.boxes) return
+        window.boxes.forEach(({ fig, box }) => {
+            fig.remove_layout(box)
+            box.visible = false
+        })
+        window.boxes = []
+    """))
 
-    # Convert timestamp to datetime for display
-    df['datetime'] = pd.to_datetime(df['timestamp'], unit='us')
-
-    # Define flight mode colors
-    flight_mode_colors = {
-        0: "#ff3300",  # Manual
-        1: "#2d2d4d",  # Altitude
-        2: "#2d4d2d",  # Position
-        3: "#4d2d2d",  # Mission
-        4: "#4d4d2d",  # Loiter
-        5: "#2d4d4d",  # Return
-        7: "#3d2d4d",  # Auto RTL
-        12: "#4d3d2d",  # Descend
-        14: "#3d4d2d",  # Offboard
-        15: "#4d2d3d",  # Stabilized
-        17: "#3d2d2d",  # Auto Takeoff
-        18: "#2d2d3d",  # Auto Land
-    }
-    flight_mode_labels = {
-        0: "Manual",
-        1: "Altitude",
-        2: "Position",
-        3: "Mission",
-        4: "Loiter",
-        5: "Return",
-        7: "Auto RTL",
-        12: "Descend",
-        14: "Offboard",
-        15: "Stabilized",
-        17: "Auto Takeoff",
-        18: "Auto Land",
-    }
+    plots = []
+    for f in figures:
+        model = figure(
+            sizing_mode="stretch_width",  # Make plot stretch to container width
+            aspect_ratio=3,  # Width:Height ratio of 3:1
+            title=f["title"],
+            x_axis_label='Time (HH:MM:SS)',
+            y_axis_label=f["unit"],  # Use the unit field instead of extracting from title
+            margin=(30, 50, 30, 50),  # (top, right, bottom, left) margins in pixels
+        )
 
-    # Check if we have annotations for this file in mapping
-    if mapping and file_name and file_name[:-4] in mapping:
-        file_annotations = mapping[file_name[:-4]]["annotations"]
-    else:
-        file_annotations = []
+        # Format x-axis to show full date and time
+        model.xaxis.formatter = CustomJSTickFormatter(code="""
+            // Convert timestamp to Date object
+            const date = new Date(tick);
+            const year = date.getFullYear();
+            const month = (date.getMonth() + 1).toString().padStart(2, '0');
+            const day = date.getDate().toString().padStart(2, '0');
+            const hours = date.getHours().toString().padStart(2, '0');
+            const minutes = date.getMinutes().toString().padStart(2, '0');
+            const seconds = date.getSeconds().toString().padStart(2, '0');
+            const miliseconds = (date.getMilliseconds()).toString().padStart(3, '0');
+            return `${hours}:${minutes}:${seconds}`;
+        """)
+
+        # Rotate x-axis labels for better readability
+        model.xaxis.major_label_orientation = 0.3
+        model.xaxis.axis_label_text_font_size = '14pt'  # Increase axis label font size
+        model.xaxis.major_label_text_font_size = '12pt'  # Increase tick label font size
+
+        # Flight mode background bands with their labels
+        model.vstrip(x0="x0", x1="x1", source=modes, fill_color="color", fill_alpha=0.2,
+                     line_color="#cccccc", line_alpha=0.3, level="underlay")
+        model.add_layout(LabelSet(
+            x="center",
+            y=0.95,
+            text="text",
+            source=modes,
+            text_color='white',
+            text_font_size='10pt',
+            text_align='center',
+            background_fill_color="color",
+            background_fill_alpha=0.7,
+            border_line_color="color",
+            border_line_alpha=0.7,
+            y_units='screen'
+        ))
+
+        # One line per column, hidden while the flight lacks the column
+        lines = []
+        for p in f["plots"]:
+            renderer = model.line(
+                "datetime", line_column(f, p),
+                source=empty,
+                legend_label=line_label(f, p),
+                line_width=2,
+                alpha=alpha
+            )
+            lines.append((p, renderer))
+        # the ranges follow the data lines only, like the former annotation models
+        model.x_range.renderers = [renderer for _, renderer in lines]
+        model.y_range.renderers = [renderer for _, renderer in lines]
+
+        # Saved annotations of the flight with their class names
+        annotations = ColumnDataSource(data=dict(x0=[], x1=[], center=[], text=[], color=[]))
+        model.vstrip(x0="x0", x1="x1", source=annotations, fill_color="color", fill_alpha=0.2,
+                     line_color="#cccccc", line_alpha=0.3, level="overlay")
+        model.add_layout(LabelSet(
+            x="center",
+            y=0,
+            text="text",
+            source=annotations,
+            text_color='white',
+            text_font_size='12pt',
+            text_font_style='bold',
+            background_fill_color='rgba(0,0,0,0.7)',  # Semi-transparent black background
+            background_fill_alpha=0.7,
+            text_align='center',
+            border_line_color='green',
+            border_line_alpha=0.7,
+        ))
+
+        # Apply theme
+        apply_plot_theme(model)
+        enable_highlight(model, figname=f["title"], loads=loads)
+        plots.append({"figure": f, "model": model, "lines": lines, "annotations": annotations})
 
+    return {"loads": loads, "flight": flight, "empty": empty, "modes": modes, "plots": plots, "models": [plot["model"] for plot in plots]}
+
+
+def flight_mode_data(df: pd.DataFrame) -> dict:
     # Get flight mode changes if available in the dataframe
     flight_modes = []
-    if 'vehicle_status.nav_state' in df.columns:
+    if 'vehicle_status.nav_state' in df.columns and len(df):
         # If there are no mode changes, create a single segment for the entire timeline
         if len(df['vehicle_status.nav_state'].unique()) == 1:
             flight_modes.append({
@@ -361,13 +501,13 @@ def plot_df(df: pd.DataFrame, mapping: dict = None, file_name: str = None):
         else:
             mode_changes = df['vehicle_status.nav_state'].diff().fillna(0) != 0
             change_indices = df.index[mode_changes].tolist()
-            
+
             # Add start and end indices
             if 0 not in change_indices:
                 change_indices.insert(0, 0)
             if len(df) - 1 not in change_indices:
                 change_indices.append(len(df) - 1)
-            
+
             # Create flight mode segments
             for i in range(len(change_indices) - 1):
                 start_idx = change_indices[i]
@@ -379,105 +519,90 @@ def plot_df(df: pd.DataFrame, mapping: dict = None, file_name: str = None):
                     'mode': mode
                 })
 
-    # Create a figure for each plot block
-    for i, f in enumerate(figures):
-        f["model"] = figure(
-            sizing_mode="stretch_width",  # Make plot stretch to container width
-            aspect_ratio=3,  # Width:Height ratio of 3:1
-            title=f["title"],
-            x_axis_label='Time (HH:MM:SS)',
-            y_axis_label=f["unit"],  # Use the unit field instead of extracting from title
-            margin=(30, 50, 30, 50),  # (top, right, bottom, left) margins in pixels
-        )
+    return {
+        "x0": [segment['start'] for segment in flight_modes],
+        "x1": [segment['end'] for segment in flight_modes],
+        "center": [segment['start'] + pd.Timedelta((segment['end'] - segment['start']) / 2)
+                   for segment in flight_modes],
+        "text": [str(flight_mode_labels.get(segment['mode'])) for segment in flight_modes],
+        "color": [flight_mode_colors.get(segment['mode'], "#1a1a1a") for segment in flight_modes],
+    }
 
-        # Format x-axis to show full date and time
-        f["model"].xaxis.formatter = CustomJSTickFormatter(code="""
-            // Convert timestamp to Date object
-            const date = new Date(tick);
-            const year = date.getFullYear();
-            const month = (date.getMonth() + 1).toString().padStart(2, '0');
-            const day = date.getDate().toString().padStart(2, '0');
-            const hours = date.getHours().toString().padStart(2, '0');
-            const minutes = date.getMinutes().toString().padStart(2, '0');
-            const seconds = date.getSeconds().toString().padStart(2, '0');
-            const miliseconds = (date.getMilliseconds()).toString().padStart(3, '0');
-            return `${hours}:${minutes}:${seconds}`;
-        """)
 
-        # Rotate x-axis labels for better readability
-        f["model"].xaxis.major_label_orientation = 0.3
-        f["model"].xaxis.axis_label_text_font_size = '14pt'  # Increase axis label font size
-        f["model"].xaxis.major_label_text_font_size = '12pt'  # Increase tick label font size
-
-        # Add flight mode background boxes
-        for mode_segment in flight_modes:
-            color = flight_mode_colors.get(mode_segment['mode'], "#1a1a1a")
-            box = BoxAnnotation(
-                left=mode_segment['start'],
-                right=mode_segment['end'],
-                fill_color=color,
-                fill_alpha=0.2,
-                level='underlay',
-            )
-            f["model"].add_layout(box)
-            
-            # Add flight mode labels over boxes
-            label = Label(
-                x=mode_segment['start'] + pd.Timedelta((mode_segment['end'] - mode_segment['start'])/2),
-                y=0.95,
-                text=str(flight_mode_labels.get(mode_segment['mode'])),
-                text_color='white',
-                text_font_size='10pt',
-                text_align='center',
-                background_fill_color=color,
-                background_fill_alpha=0.7,
-                border_line_color=color,
-                border_line_alpha=0.7,
-                y_units='screen'
-            )
-            f["model"].add_layout(label)
+# Show the flight in the plots of create_plots(), highlight the anomalies and return the models.
+# float32 sends the plotted values as float32, which halves the payload of a flight
+def update_plots(plots: dict, df: pd.DataFrame, mapping: dict = None, file_name: str = None,
+                 float32: bool = False):
+    colors = itertools.cycle(palette)
 
-        # Plot each column in the figure (data lines)
-        for p in f["plots"]:
-            try:
-                # Normal plotting for non-quaternion data
-                y = df[p["col"]]
-                x = df['datetime']
-
-                # Check if this is a quaternion plot
-                if f["title"] == "Attitude Roll":
-                    y, _, _, label = check_quaternion_plot(df, p["col"])
-                    label = "Roll " + label
-                elif f["title"] == "Attitude Pitch":
-                    _, y, _, label = check_quaternion_plot(df, p["col"])
-                    label = "Pitch " + label
-                else:
-                    label = p["label"]
-
-                f["model"].line(
-                    x, y,
-                    color=next(colors),
-                    legend_label=label,
-                    line_width=2,
-                    alpha=alpha
-                )
-            except Exception as e:
-                pass
+    # Convert timestamp to datetime for display
+    # load_flight() adds the time axis already
+    if 'datetime' not in df.columns:
+        df['datetime'] = pd.to_datetime(df['timestamp'], unit='us')
+
+    # Check if we have annotations for this file in mapping
+    file_base = os.path.splitext(file_name)[0] if file_name else None
+    if mapping and file_base in mapping:
+        file_annotations = mapping[file_base]["annotations"]
+    else:
+        file_annotations = []
+
+    plots["loads"].data = dict(count=[plots["loads"].data["count"][0] + 1])
+    plots["modes"].data = flight_mode_data(df)
+
+    data = {"datetime": df['datetime'].to_numpy()}
+    shown = []
+    for plot in plots["plots"]:
+        f = plot["figure"]
+        # Plot each column in the figure (data lines), the colors follow the shown lines
+        for p, renderer in plot["lines"]:
+            name = line_column(f, p)
+            if name not in data:
+                try:
+                    data[name] = np.asarray(line_values(df, f, p), dtype=np.float32 if float32 else None)
+                except (KeyError, ValueError):
+                    # the flight lacks the column, or it holds no numbers
+                    data[name] = None
+                except Exception as error:
+                    print(f"Could not plot {p['col']} in {f['title']}: {error!r}")
+                    data[name] = None
+            if data[name] is None:
+                # detach the line before its column leaves the flight source
+                if renderer.data_source is not plots["empty"]:
+                    renderer.data_source = plots["empty"]
+                renderer.visible = False
+                continue
+            color = next(colors)
+            if renderer.glyph.line_color != color:
+                renderer.glyph.line_color = color
+            shown.append(renderer)
+
+        # a legend entry can group several lines with the same label
+        legend = plot["model"].legend[0]
+        for item in legend.items:
+            item.visible = any(renderer in shown for renderer in item.renderers)
+        legend.visible = any(item.visible for item in legend.items)
 
         # Add annotations to the plot
-        box_and_labels = get_annotation_box_and_label(file_annotations, f["title"])
-        for box, label in box_and_labels:
-            f["model"].add_layout(box)
-            f["model"].add_layout(label)
+        plot["annotations"].data = get_annotation_data(file_annotations, f["title"])
 
-        # Apply theme
-        apply_plot_theme(f["model"])
-        enable_highlight(f["model"], figname=f["title"])
+    plots["flight"].data = {name: values for name, values in data.items() if values is not None}
+    # attach the lines once their columns are in the source
+    for renderer in shown:
+        if renderer.data_source is not plots["flight"]:
+            renderer.data_source = plots["flight"]
+        renderer.visible = True
+
+    return plots["models"]
 
-    return [f["model"] for f in figures]
 
-def get_annotation_box_and_label(file_annotations, plot_title):
-    box_and_labels = []
+def plot_df(df: pd.DataFrame, mapping: dict = None, file_name: str = None):
+    # New figures showing a single flight
+    return update_plots(create_plots(), df, mapping, file_name)
+
+
+def get_annotation_data(file_annotations, plot_title):
+    data = dict(x0=[], x1=[], center=[], text=[], color=[])
     for annotation in file_annotations:
         # Get the class and ranges for this annotation
         anomaly_class = annotation["class"]
@@ -486,43 +611,29 @@ def get_annotation_box_and_label(file_annotations, plot_title):
         for col, col_ranges in ranges:
             if col == plot_title: color = 'red' 
             else: color = 'green'
-            # Create box annotations for each range
+            # One band for each range
             for start, end in col_ranges:
                 # Convert timestamp microseconds to datetime
                 start_dt = pd.to_datetime(start, unit='us')
                 end_dt = pd.to_datetime(end, unit='us')
-                
-                box = BoxAnnotation(
-                    left=start_dt,
-                    right=end_dt,
-                    fill_alpha=0.2,
-                    fill_color=color,
-                    level='overlay'
-                )
-
-                # Add label at the center of the box
-                center_dt = start_dt + (end_dt - start_dt)/2
-                label = Label(
-                    x=center_dt,
-                    y=0,
-                    text=anomaly_class,
-                    text_color='white',
-                    text_font_size='12pt',
-                    text_font_style='bold',
-                    background_fill_color='rgba(0,0,0,0.7)',  # Semi-transparent black background
-                    background_fill_alpha=0.7,
-                    text_align='center',
-                    border_line_color='green',
-                    border_line_alpha=0.7,
-                )
-                box_and_labels.append((box, label))
-    return box_and_labels
-
-
-def enable_highlight(fig: Model, figname: str):
-    # JavaScript to manage the box drawing
+
+                data["x0"].append(start_dt)
+                data["x1"].append(end_dt)
+                # Add label at the center of the band
+                data["center"].append(start_dt + (end_dt - start_dt)/2)
+                data["text"].append(anomaly_class)
+                data["color"].append(color)
+    return data
+
+
+def enable_highlight(fig: Model, figname: str, loads: ColumnDataSource = None):
+    # JavaScript to manage the box drawing. loads is only referenced to put the
+    # load counter of create_plots() into the document, its changes clear the boxes
+    args = dict(fig=fig, figname=figname)
+    if loads is not None:
+        args["loads"] = loads
     callback = CustomJS(
-        args=dict(fig=fig, figname=figname),
+        args=args,
         code="""
         const tools = fig.toolbar.tools
         const activeTool = tools.find(tool => tool.active)